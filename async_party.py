@@ -0,0 +1,128 @@
+# dataflow evaluation of the circuit (config.ENGINE = 'async')
+#
+# every gate is a coroutine that awaits the futures of its input wires, so a
+# gate runs as soon as its operands are ready rather than when the rest of
+# its layer is - independent sub-circuits no longer wait for each other.
+# shares are exchanged through network.AsyncNetwork
+
+import asyncio # create_task, gather, run
+
+import log
+
+from circuit import ALL_PARTIES, DEGREE, FUNCTION_RESULT, INP, PRODUCTS
+from config  import KING, MUL_PROTOCOL, PACKING
+from modprime import add, sub
+from party   import BgwProtocol
+from beaver  import open_triples
+from wiring  import WIRING, linear_gate, local_product
+
+assert PACKING == 1, "The async engine doesn't support packing :-("
+
+class AsyncBgwProtocol(BgwProtocol):
+
+    def __init__(self, party_no, private_value, network, expected=FUNCTION_RESULT):
+        log.write(f"Started async BGW for party {party_no} with private value {private_value}")
+
+        self.network = network
+        self.secret = private_value
+        self.party_no = party_no
+        self.result = self.correct = None
+        self.expected = expected
+        self.prss = None
+
+        # Multiplication triples, generated offline
+        self.store = open_triples(party_no) if MUL_PROTOCOL == 'beaver' else None
+
+        asyncio.run(self.process_gates())
+
+    async def process_gates(self):
+        # A future for our share on each gate's output wire, indexed by gate
+        # id - freed once all its readers have it, as in BgwProtocol
+        loop = asyncio.get_running_loop()
+        self.wires = [loop.create_future() for _ in WIRING.types]
+        self.readers = [len(fanout) for fanout in WIRING.fanout]
+        receiver = asyncio.create_task(self.network.receiver())
+
+        # The run of triples to use is agreed while the inputs are shared,
+        # MUL gates wait for it - see BgwProtocol
+        if self.store:
+            self.store.announce(self.network)
+            self.agreed = asyncio.create_task(self.agree_triples())
+
+        # Double sharings for the whole circuit, before any MUL gate needs one
+        if MUL_PROTOCOL == 'dn':
+            self.doubles = {}
+            senders = self.deal_doubles()
+            if senders is not None:
+                self.finish_doubles({party: await self.network.receive_share(party, 0)
+                                     for party in senders})
+
+        await asyncio.gather(*(self.evaluate(gate) for gate in WIRING.gates))
+        receiver.cancel()
+
+        # Print blank line to separate parties in the logs
+        log.write('')
+
+    async def evaluate(self, gate):
+        kind = WIRING.types[gate]
+        inputs = []
+        for src in WIRING.sources[gate]:
+            await self.wires[src]
+            inputs.append(self.read_wire(src).result())
+        log.debug(f"Gate {gate}: Inputs are {inputs}", 2)
+
+        if kind == INP:
+            # Each party has an input gate with id = their party number
+            if gate == self.party_no:
+                self.split_and_send_shares({gate: self.secret})
+            output = await self.network.receive_share(gate, gate)
+        elif kind in PRODUCTS:
+            output = await self.multiply(gate, inputs)
+        else:
+            output = linear_gate(kind, inputs, WIRING.constants.get(gate))
+        log.debug(f"Gate {gate}: Output of gate is {output}", 1)
+
+        await self.set_output(output, gate)
+
+    async def agree_triples(self):
+        announced = {party: await self.network.receive_share(party, 0)
+                     for party in ALL_PARTIES}
+        self.triples = self.store.agree(announced)
+
+    async def multiply(self, gate, inputs):
+        if MUL_PROTOCOL == 'beaver':
+            await self.agreed
+            for party in ALL_PARTIES:
+                self.network.send_share(self.beaver_mask(gate, inputs), gate, party)
+            party_shares = await self.network.receive_any(ALL_PARTIES, gate, DEGREE+1)
+            return self.beaver_output(gate, party_shares)
+
+        if MUL_PROTOCOL == 'dn':
+            r_t, r_2t = self.doubles[gate]
+            self.network.send_share(add(local_product(inputs), r_2t), gate, KING)
+            if self.party_no == KING:
+                party_shares = await self.network.receive_any(ALL_PARTIES, gate, 2*DEGREE+1)
+                opened = self.get_secret(party_shares, 2*DEGREE)
+                for party in ALL_PARTIES:
+                    self.network.send_share(opened, gate, party)
+            return sub(await self.network.receive_share(KING, gate), r_t)
+
+        # BGW degree reduction by a fixed set of 2T+1 parties, see party.py
+        dealers = tuple(ALL_PARTIES[:2*DEGREE+1])
+        if self.party_no in dealers:
+            self.split_and_send_shares({gate: local_product(inputs)})
+        party_shares = {party: await self.network.receive_share(party, gate)
+                        for party in dealers}
+        return self.get_secret(party_shares, 2*DEGREE)
+
+    async def set_output(self, output, gate):
+        # Resolve the wire for the gates waiting on it, or open the output
+        if gate != WIRING.output:
+            self.wires[gate].set_result(output)
+        else:
+            wire, _leg = WIRING.output_wire
+            for party in ALL_PARTIES:
+                self.network.send_share(output, wire, party)
+            party_shares = await self.network.receive_any(ALL_PARTIES, wire, DEGREE+1)
+            log.debug(f"Gate {gate}: Party shares is {party_shares}", 2)
+            self.report(party_shares, gate)
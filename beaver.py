@@ -0,0 +1,172 @@
+# Beaver multiplication triples (config.MUL_PROTOCOL = 'beaver')
+#
+# offline, before inputs are known, the parties generate shares of random
+# a, b and c = a*b - every party shares random contributions to a and b,
+# and c is computed with one BGW degree reduction for all triples at once.
+# online, x*y = c + d*b + e*a + d*e where d = x-a and e = y-b are opened,
+# so a MUL layer only costs opening two masked values per product
+#
+# the triples of one run must be the same at every party. each party keeps
+# a counter of the runs it used and announces it with its input shares,
+# then all take the highest run announced
+
+import json   # dump, load
+import os     # makedirs, replace
+
+import numpy as np
+
+import log
+
+from circuit import ALL_PARTIES, BATCH, CIRCUIT, DEGREE, PRIME, PRODUCTS
+from codec   import WIDTH
+from config  import OFFLINE_RUNS, PRSS, TRIPLES_FILE
+from modprime import DTYPE, add, array, mul, randoms, reconstruct, share
+from prss    import setup_prss
+from wiring  import WIRING
+
+# runs a daemon reserves from its store at a time
+RESERVE = 100
+
+# field elements per announced run number, enough for 32 bits
+RUN_DIGITS = -(-32 // (PRIME.bit_length() - 1))
+
+# ---------------------------------------------------------------------------
+
+def triples_needed():
+  # one triple per pair of legs of every MUL and DOT gate
+  return sum(len(WIRING.sources[gate]) // 2 for gate in WIRING.gates
+             if WIRING.types[gate] in PRODUCTS)
+
+def generate_triples(party_no, network):
+  # enough triples for OFFLINE_RUNS evaluations of the circuit, each triple
+  # holds a vector of values in batch mode
+  count = OFFLINE_RUNS * triples_needed()
+  shape = (count, BATCH) if BATCH else (count,)
+
+  if PRSS:
+    # a and b come straight from the PRSS seeds, gate id 0 deals them
+    a, b = setup_prss(party_no, network).random((2,) + shape)
+  else:
+    # share our random contributions to a and b with every party, gate ids
+    # 1 and 2 tag the two rounds
+    shares = share(randoms((2,) + shape))
+    for party in ALL_PARTIES:
+      network.send_share(shares[party-1].ravel(), 1, party)
+    network.flush()
+
+    a = b = 0
+    for party in ALL_PARTIES:
+      contribution = network.receive_share(party, 1).reshape((2,) + shape)
+      a, b = add(a, contribution[0]), add(b, contribution[1])
+
+  # c = a*b - reshare our degree 2T products and reduce, as for a MUL gate
+  subshares = share(mul(a, b))
+  for party in ALL_PARTIES:
+    network.send_share(subshares[party-1].ravel(), 2, party)
+  network.flush()
+
+  products = {party: network.receive_share(party, 2).reshape(shape)
+              for party in ALL_PARTIES}
+  c = reconstruct(products, 2*DEGREE)
+
+  save_triples(party_no, a, b, c)
+  log.write(f'Generated {count} multiplication triples')
+
+def save_triples(party_no, a, b, c):
+  # written once - runs take their triples by position, so the store is
+  # never rewritten, only the run counter next to it
+  filename = TRIPLES_FILE.format(party_no)
+  os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+  np.save(filename, to_words(np.stack([a, b, c])))
+  save_state(party_no, {'circuit': CIRCUIT, 'prime': str(PRIME),
+                        'runs': OFFLINE_RUNS, 'next': 0})
+
+def to_words(triples):
+  # word sized fields as they are, big fields as WIDTH big-endian bytes per
+  # element - np.save would pickle python ints
+  if DTYPE != object:
+    return triples
+  data = b''.join(int(v).to_bytes(WIDTH, 'big') for v in triples.ravel())
+  return np.frombuffer(data, np.uint8).reshape(triples.shape + (WIDTH,))
+
+def from_words(words):
+  if DTYPE != object:
+    return array(words)
+  rows = words.reshape(-1, WIDTH)
+  return array([int.from_bytes(row.tobytes(), 'big') for row in rows]).reshape(words.shape[:-1])
+
+def state_file(party_no):
+  return os.path.splitext(TRIPLES_FILE.format(party_no))[0] + '.json'
+
+def save_state(party_no, state):
+  # replace in one step, so a party killed mid-write keeps the old counter
+  filename = state_file(party_no)
+  with open(filename + '.tmp', 'w') as f:
+    json.dump(state, f)
+  os.replace(filename + '.tmp', filename)
+
+class Triples():
+  # a party's store, opened once - a daemon keeps it for every job. the
+  # counter file holds the first run not yet handed out and is moved on
+  # `reserve` runs at a time, so a daemon doesn't write a file per job.
+  # runs reserved by a process that exits are skipped, never reused
+
+  def __init__(self, party_no, reserve=1):
+    self.party_no, self.reserve = party_no, reserve
+    filename = TRIPLES_FILE.format(party_no)
+    assert os.path.exists(filename), "No triples, run 'make offline' first :-("
+    with open(state_file(party_no)) as f:
+      self.state = json.load(f)
+    assert self.state['circuit'] == CIRCUIT and int(self.state['prime']) == PRIME, \
+      "Triples were generated for another circuit :-("
+    self.store = np.load(filename, mmap_mode='r', allow_pickle=False)
+    self.next = self.reserved = self.state['next']
+
+  def announce(self, network):
+    # tell every party the next run we may use, with gate id 0 which is
+    # never a real gate - queued, so it goes out with our input shares
+    for party in ALL_PARTIES:
+      network.send_share(encode_run(self.next), 0, party)
+
+  def agree(self, announced):
+    # every party takes the highest run announced. a party may have used
+    # runs that others never did - after a daemon job that failed at some
+    # parties, or a run some party crashed in - and would otherwise
+    # combine its triples with other triples than the rest
+    return self.take(max(decode_run(digits) for digits in announced.values()))
+
+  def take(self, run):
+    # the run's triples, allocated to gates in evaluation order - only this
+    # run's slice of the store is read
+    assert run >= self.next, "Triples were used already :-("
+    assert run < self.state['runs'], "Not enough triples, run 'make offline' :-("
+    if run >= self.reserved:
+      self.reserved = min(run + self.reserve, self.state['runs'])
+      save_state(self.party_no, dict(self.state, next=self.reserved))
+    self.next = run + 1
+
+    needed = triples_needed()
+    a, b, c = from_words(self.store[:, run*needed:(run+1)*needed])
+    triples, start = {}, 0
+    for gate in WIRING.gates:
+      if WIRING.types[gate] in PRODUCTS:
+        end = start + len(WIRING.sources[gate]) // 2
+        triples[gate] = [t[start:end] if BATCH else t[start:end].tolist()
+                         for t in (a, b, c)]
+        start = end
+    return triples
+
+def open_triples(party_no, store=None):
+  # the store a daemon keeps open, or our own for a single run - None if
+  # the circuit has no products and needs no triples
+  if not triples_needed():
+    return None
+  return store or Triples(party_no)
+
+def encode_run(run):
+  bits = PRIME.bit_length() - 1
+  return array([(run >> (bits*i)) & ((1 << bits) - 1) for i in range(RUN_DIGITS)])
+
+def decode_run(digits):
+  bits = PRIME.bit_length() - 1
+  return sum(int(digit) << (bits*i) for i, digit in enumerate(digits))
@@ -8,7 +8,10 @@
 CIRCUIT = 1
 
 # Gate types
-INP, ADD, MUL = (0,1,2)
+from gates import INP, ADD, MUL, SUB, NEG, ADDC, MULC, DOT, LINEAR, PRODUCTS
+
+# Circuits can also be compiled from an arithmetic expression (compiler.py)
+from compiler import compile_expression
 
 # Define MPC Function as an addition/multiplication circuit. INPut gates 
 # precede ADD/MUL gates. ADD/MUL gates are defined in evaluation order. 
@@ -195,22 +198,10 @@ elif CIRCUIT == 7:
 
     return product % PRIME
   
+  # The compiler builds a balanced MUL tree of depth log2(EXP) instead of
+  # a chain of depth EXP-1
   def make_gates(private):
-    gates = {} # Initialize our circuit to empty
-    size = len(private) # Need to know the size of PRIVATE_VALUES since it is EXP
-
-    gates[1] = (INP, size+1, 1)
-    gates[2] = (INP, size+1, 1)
-    
-    for i in range(3,size+1):
-      gates[i] = (INP, size + i -1, 1) # SET Input gates 
-    
-    # Set multiplication gates that send 
-    # their result to the next multiplication gate
-    for i in range(size+1, 2*size):
-      gates[i] = (MUL, i+1, 1)
-    
-    return gates
+    return compile_expression('*'.join(f'x{k}' for k in private))
   
   GATES = make_gates(PRIVATE_VALUES) # Assign GATES the value of the circuit
 
@@ -222,7 +213,9 @@ elif CIRCUIT == 8:
   # estimate = 3x + 9
   num_points = 2
 
-  DEGREE = num_points
+  # two parties per point (target, estimate), so 2T < N needs T below
+  # num_points - with a third party per point inputting -1 it was num_points
+  DEGREE = num_points - 1
   PRIME = 100_003
 
   # Generate values for target function
@@ -233,17 +226,17 @@ elif CIRCUIT == 8:
 
   PRIVATE_VALUES = {}
 
-  # Create private values by mixing target, estimate and -1 
+  # Create private values by pairing target and estimate, the difference
+  # is taken by a local SUB gate so no party needs to input -1
   for i in target:
-    PRIVATE_VALUES[3*i -2] = target[i]
-    PRIVATE_VALUES[3*i+1 -2] = estimate[i]
-    PRIVATE_VALUES[3*i+2 -2] = -1
+    PRIVATE_VALUES[2*i -1] = target[i]
+    PRIVATE_VALUES[2*i] = estimate[i]
   
   # Our function is a squared error loss function
   def function(x):
     loss_sum = 0
     for i in range(1,len(x)+1):
-      if (i % 3 == 1):
+      if (i % 2 == 1):
         loss_sum = (loss_sum + (x[i] - x[i+1])**2)
     
     return loss_sum % PRIME
@@ -253,83 +246,48 @@ elif CIRCUIT == 8:
     Takes in private values and generates a circuit to evaluate
     squared error of estimate on target
 
-    The design of the circuit follows a pattern
-
-    For each pair there:
-       are 3 input gates
-       5 gates used to create the pair error 
-    
-    Since each pair uses the same sub circuit to calculate it's error
-    we can increment by 5 to get the next gate that needs similar behaviour
-    
-    After that we need to sum the errors together
-    There are len(private)/3 pairs to count 
-
-    We create gates for that 
-    Those gates start at len(private) * (3 + 5) + 1
-
+    For each (target, estimate) pair a SUB gate takes the difference,
+    and both legs of one pair in a single DOT gate read it - the squares
+    are summed with one degree reduction for the whole loss
     """
-    
-    # determines the amout of points
-    # points are grouped in 3 (target_value, estimate, -1)
-    size = int(len(private)/3)
-    gates = {} # initialize gates dictionary
-
-    # used to see where each target estimate pair has been counted 
-    # then gates are numbered after adders + 1 forward to sum errors together
-    adders = size*8
-
-    # determines how many pairs have been counted
-    end_counter = 0
-    psize = len(private) #input size
-
-
-    # Creating input gates
-    for i in range(1, psize+1):
-      if (i % 3 == 1):
-        gates[i] = (INP, [(psize+2 + (i//3)*5, 1), (psize+4 + (i//3)*5, 1)])
-      
-      if (i % 3 == 2):
-        gates[i] = (INP, [(psize+1 + (i//3)*5, 1), (psize+3 + (i//3)*5, 1)])
-      
-      if (i %3 == 0):
-        gates[i] = (INP, [(psize+1 + (i//3-1)*5, 1), (psize+3 + (i//3-1)*5, 1)])
-    
-    # Creating gates that calculate error for each pair
-    for i in range(psize+1,size*8+1):
-
-      if ((i-psize)%5 == 1):
-        gates[i] = (MUL, i+1, 1)
-      
-      if ((i-psize)%5 == 2):
-        gates[i] = (ADD, i+3,1) 
-      
-      if ((i-psize)%5 == 3):
-        gates[i] = (MUL, i+1, 1)
-      
-      if ((i-psize)%5 == 4):
-        gates[i] = (ADD, i+1, 1)
-      
-      if ((i-psize)%5 == 0):
-        end_counter += 1
-        if (end_counter == 1 or end_counter == 2):
-          gates[i] = (MUL, adders+1,1)
-        else:
-          gates[i] = (MUL, adders+end_counter-1, 1)
-  
-    # Creating the gates that sum the errors together
-    for x in range(adders+1, adders + end_counter):
-      gates[x] = (ADD, x+1, 1)
-    
-    return gates
+    size = len(private) // 2
+    errors = [f'(x{2*i-1} - x{2*i})*(x{2*i-1} - x{2*i})' for i in range(1, size+1)]
+    return compile_expression(' + '.join(errors))
   
   GATES = make_circuit(PRIVATE_VALUES)
   #print(GATES)
    
+# _______________________________________________
+# Batch mode - circuit 1 evaluated over RECORDS input vectors in one run
+elif CIRCUIT == 9:
+  PRIME  = 100_003
+  DEGREE = 2
+
+  RECORDS = 10_000
+
+  # each party holds a vector with one value per record
+  PRIVATE_VALUES = {p: [(p * r + 7) % PRIME for r in range(RECORDS)]
+                    for p in range(1, 7)}
+
+  def function(x):	# evaluated per record
+    return (x[1]*x[2] + x[3]*x[4] + x[5]*x[6]) % PRIME
+
+  # compiles to a single DOT gate - one degree reduction for all 3 products
+  GATES = compile_expression("x1*x2 + x3*x4 + x5*x6")
 
 #_____________________________________________________________
+# batch mode - if parties hold vectors of values every wire carries a vector
+# of shares and the circuit is evaluated for each record (element) at once
+BATCH = None
+if isinstance(PRIVATE_VALUES[1], (list, tuple)):
+  BATCH = len(PRIVATE_VALUES[1])
+
 # true function result - used to check result from MPC circuit
-FUNCTION_RESULT = function(PRIVATE_VALUES)
+if BATCH:
+  FUNCTION_RESULT = [function({p: v[r] for p, v in PRIVATE_VALUES.items()})
+                     for r in range(BATCH)]
+else:
+  FUNCTION_RESULT = function(PRIVATE_VALUES)
 
 N_GATES     = len(GATES)
 N_PARTIES   = len(PRIVATE_VALUES)
@@ -339,6 +297,10 @@ ALL_DEGREES = range(1, DEGREE+1)
 assert PRIME > N_PARTIES, "Prime > N failed :-("
 assert 2*DEGREE < N_PARTIES, "2T < N failed :-("
 
+# the party that opens DN products must take part, or every party waits on it
+from config import KING
+assert KING in ALL_PARTIES, "KING in parties failed :-("
+
 # Various Primes 
 # PRIME = 11
 # PRIME = 101
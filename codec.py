@@ -0,0 +1,90 @@
+# compact binary encoding for batches of shares sent between parties
+#
+#   message = sender session count (gate size share)*
+#
+# sender, session, count, gate ids and sizes are unsigned varints (7 bits
+# per byte, high bit set on all but the last byte); shares are field
+# elements, written as fixed-width big-endian integers wide enough for any
+# value mod PRIME.
+#
+# size is 0 for a single field element, otherwise one more than the length
+# of a vector of shares (batch mode), so an empty vector stays a vector.
+#
+# session tags the job the shares belong to when a party daemon evaluates
+# many circuits over one network (daemon.py)
+
+import numpy as np
+
+from circuit import PRIME
+from modprime import DTYPE
+
+WIDTH = (PRIME.bit_length() + 7) // 8   # bytes per field element
+
+# ---------------------------------------------------------------------------
+
+def put_varint(buf, n):
+  while n >= 0x80:
+    buf.append((n & 0x7F) | 0x80)
+    n >>= 7
+  buf.append(n)
+
+def get_varint(data, pos):
+  n = shift = 0
+  while True:
+    byte = data[pos]
+    pos += 1
+    n |= (byte & 0x7F) << shift
+    if byte < 0x80:
+      return n, pos
+    shift += 7
+
+def put_share(buf, share):
+  if np.ndim(share) == 0:
+    put_varint(buf, 0)
+    buf += int(share).to_bytes(WIDTH, 'big')
+  else:
+    put_varint(buf, len(share) + 1)
+    if WIDTH <= 8:
+      # whole vector at once - keep the low WIDTH bytes of each 64 bit word
+      words = np.asarray(share).astype('>u8').view(np.uint8).reshape(-1, 8)
+      buf += words[:, 8-WIDTH:].tobytes()
+    else:
+      for element in share:
+        buf += int(element).to_bytes(WIDTH, 'big')
+
+def get_share(data, pos):
+  size, pos = get_varint(data, pos)
+  if size == 0:
+    return int.from_bytes(data[pos:pos+WIDTH], 'big'), pos+WIDTH
+  size -= 1
+  if WIDTH <= 8:
+    words = np.zeros((size, 8), dtype=np.uint8)
+    words[:, 8-WIDTH:] = np.frombuffer(data, np.uint8, size*WIDTH, pos).reshape(size, WIDTH)
+    share = words.view('>u8').ravel().astype(DTYPE)
+  else:
+    share = np.array([int.from_bytes(data[i:i+WIDTH], 'big')
+                      for i in range(pos, pos + size*WIDTH, WIDTH)], dtype=object)
+  return share, pos + size*WIDTH
+
+def encode(sender, items, session=0):
+  # items is a list of (gate, share) pairs
+  buf = bytearray()
+  put_varint(buf, sender)
+  put_varint(buf, session)
+  put_varint(buf, len(items))
+  for gate, share in items:
+    put_varint(buf, gate)
+    put_share(buf, share)
+  return bytes(buf)
+
+def decode(data):
+  # returns (sender, session, [(gate, share), ...])
+  sender, pos = get_varint(data, 0)
+  session, pos = get_varint(data, pos)
+  count, pos = get_varint(data, pos)
+  items = []
+  for _ in range(count):
+    gate, pos = get_varint(data, pos)
+    share, pos = get_share(data, pos)
+    items.append((gate, share))
+  return sender, session, items
@@ -0,0 +1,207 @@
+# compiles an arithmetic expression into a GATES table for circuit.py
+#
+# the source is a small python-like DSL - optional assignments followed by
+# the output expression, party inputs are x1, x2, ... and integers are public
+# constants, e.g.
+#
+#   t = x1*x2
+#   t*x3 - 2*t*x4 + 1
+#
+# +, - and * of secrets, unary minus and constants are supported, constants
+# are folded and become communication-free SUB, NEG, ADDC and MULC gates
+#
+# passes:
+#   balancing  - chains of + and * are flattened and rebuilt as trees that
+#                combine the shallowest operands first, which minimises the
+#                multiplicative depth (= communication rounds)
+#   fusion     - products summed together become a single DOT gate, which
+#                needs one degree reduction for the whole sum
+#   cse        - gates are hash-consed, so a repeated sub-expression is
+#                evaluated once and fans out to all its uses
+#   dead gates - only gates the output depends on are emitted
+#
+# usage: python3 compiler.py "x1*x2*x3*x4"
+
+import ast     # parse
+import heapq   # heappush, heappop
+import sys     # argv
+
+from gates import INP, ADD, MUL, SUB, NEG, ADDC, MULC, DOT, PRODUCTS, NAMES
+
+# ---------------------------------------------------------------------------
+
+class Constant():
+  # public constant - folded at compile time, never a gate of its own
+  def __init__(self, value):
+    self.value = value
+
+class Compiler():
+  def __init__(self):
+    self.nodes = []    # (type, operands, constant) in creation (= evaluation) order
+    self.index = {}    # (type, operands, constant) -> node, for hash-consing
+    self.depths = []   # multiplicative depth of each node
+    self.names = {}    # assigned variable -> node or Constant
+
+  def node(self, kind, operands, constant=None):
+    if kind in (ADD, MUL):
+      operands = tuple(sorted(operands))   # commutative - canonical form
+    if kind == NEG and self.nodes[operands[0]][0] == NEG:
+      return self.nodes[operands[0]][1][0]  # -(-x) = x
+    key = (kind, operands, constant)
+    if key not in self.index:
+      if kind == INP:
+        depth = 0
+      else:
+        depth = max(self.depths[n] for n in operands) + (kind in PRODUCTS)
+      self.index[key] = len(self.nodes)
+      self.nodes.append(key)
+      self.depths.append(depth)
+    return self.index[key]
+
+  def balance(self, kind, operands):
+    # combine the two shallowest operands until one is left (huffman style)
+    heap = [(self.depths[n], n) for n in operands]
+    heapq.heapify(heap)
+    while len(heap) > 1:
+      _, a = heapq.heappop(heap)
+      _, b = heapq.heappop(heap)
+      n = self.node(kind, (a, b))
+      heapq.heappush(heap, (self.depths[n], n))
+    return heap[0][1]
+
+  def flatten(self, expr, kind, operands, sign=1):
+    # collect the (sign, operand) pairs of a chain of + and - or of *
+    op = type(expr.op) if isinstance(expr, ast.BinOp) else None
+    if (kind == ADD and op in (ast.Add, ast.Sub)) or (kind == MUL and op == ast.Mult):
+      self.flatten(expr.left, kind, operands, sign)
+      self.flatten(expr.right, kind, operands, -sign if op == ast.Sub else sign)
+    else:
+      operands.append((sign, self.expression(expr)))
+    return operands
+
+  def fuse(self, terms):
+    # replace the products among the terms of a sum by one DOT gate
+    products = [n for n in terms if self.nodes[n][0] in PRODUCTS]
+    if len(products) < 2:
+      return terms
+    pairs = []
+    for n in products:
+      operands = self.nodes[n][1]
+      pairs += [operands[i:i+2] for i in range(0, len(operands), 2)]
+    pairs.sort()    # canonical form for hash-consing
+    dot = self.node(DOT, tuple(x for pair in pairs for x in pair))
+    return [n for n in terms if n not in products] + [dot]
+
+  def sum(self, operands):
+    constant = sum(sign * n.value for sign, n in operands if isinstance(n, Constant))
+    positive = self.fuse([n for sign, n in operands if sign > 0 and not isinstance(n, Constant)])
+    negative = self.fuse([n for sign, n in operands if sign < 0 and not isinstance(n, Constant)])
+    if positive and negative:
+      n = self.node(SUB, (self.balance(ADD, positive), self.balance(ADD, negative)))
+    elif positive:
+      n = self.balance(ADD, positive)
+    elif negative:
+      n = self.node(NEG, (self.balance(ADD, negative),))
+    else:
+      return Constant(constant)
+    return self.node(ADDC, (n,), constant) if constant else n
+
+  def product(self, operands):
+    constant = 1
+    for _, n in operands:
+      if isinstance(n, Constant):
+        constant *= n.value
+    factors = [n for _, n in operands if not isinstance(n, Constant)]
+    if not factors or constant == 0:
+      return Constant(constant)
+    n = self.balance(MUL, factors)
+    return self.node(MULC, (n,), constant) if constant != 1 else n
+
+  def expression(self, expr):
+    if isinstance(expr, ast.BinOp) and type(expr.op) in (ast.Add, ast.Sub):
+      return self.sum(self.flatten(expr, ADD, []))
+    if isinstance(expr, ast.BinOp) and type(expr.op) == ast.Mult:
+      return self.product(self.flatten(expr, MUL, []))
+    if isinstance(expr, ast.UnaryOp) and type(expr.op) in (ast.USub, ast.UAdd):
+      n = self.expression(expr.operand)
+      if type(expr.op) == ast.UAdd:
+        return n
+      return Constant(-n.value) if isinstance(n, Constant) else self.node(NEG, (n,))
+    if isinstance(expr, ast.Constant) and type(expr.value) == int:
+      return Constant(expr.value)
+    if isinstance(expr, ast.Name):
+      if expr.id in self.names:
+        return self.names[expr.id]
+      if expr.id[:1] == 'x' and expr.id[1:].isdigit() and int(expr.id[1:]) > 0:
+        return self.node(INP, (int(expr.id[1:]),))
+      raise ValueError(f"Unknown variable {expr.id}")
+    raise ValueError(f"Unsupported expression {ast.dump(expr)}")
+
+  def compile(self, source, parties=None):
+    statements = ast.parse(source).body
+    assert statements and isinstance(statements[-1], ast.Expr), \
+      "Circuit must end with its output expression :-("
+    for statement in statements[:-1]:
+      if not (isinstance(statement, ast.Assign) and len(statement.targets) == 1
+              and isinstance(statement.targets[0], ast.Name)):
+        raise ValueError(f"Unsupported statement {ast.dump(statement)}")
+      self.names[statement.targets[0].id] = self.expression(statement.value)
+    output = self.expression(statements[-1].value)
+    assert not isinstance(output, Constant) and self.nodes[output][0] != INP, \
+      "Output must be computed by a gate :-("
+    return self.emit(output, parties)
+
+  def emit(self, output, parties):
+    # dead gate removal - keep only the nodes the output depends on
+    live = {output}
+    for n in range(output, -1, -1):
+      if n in live and self.nodes[n][0] != INP:
+        live.update(self.nodes[n][1])
+
+    # party p's INP gate is gate p, other gates follow in evaluation order
+    inputs = {self.nodes[n][1][0]: n for n in range(len(self.nodes))
+              if self.nodes[n][0] == INP}
+    parties = parties or max(inputs)
+    assert max(inputs) <= parties, "Input from unknown party :-("
+    ids = {n: p for p, n in inputs.items()}
+    next_id = parties + 1
+    for n in range(len(self.nodes)):
+      if n in live and self.nodes[n][0] != INP:
+        ids[n] = next_id
+        next_id += 1
+
+    kinds = {g: INP for g in range(1, parties+1)}
+    destinations = {g: [] for g in range(1, next_id)}
+    for n, g in sorted(ids.items(), key=lambda item: item[1]):
+      kinds[g] = self.nodes[n][0]
+      if n in live and kinds[g] != INP:
+        for leg, operand in enumerate(self.nodes[n][1], 1):
+          destinations[ids[operand]].append((g, leg))
+    destinations[ids[output]].append((next_id, 1))   # circuit output wire
+
+    constants = {g: self.nodes[n][2] for n, g in ids.items()
+                 if self.nodes[n][2] is not None}
+    gates = {}
+    for g in range(1, next_id):
+      if len(destinations[g]) == 1:
+        gates[g] = (kinds[g],) + destinations[g][0]
+      else:
+        gates[g] = (kinds[g], destinations[g])
+      if g in constants:
+        gates[g] += (constants[g],)
+
+    self.n_gates, self.depth = len(gates), self.depths[output]
+    return gates
+
+def compile_expression(source, parties=None):
+  # GATES table for source, with INP gates for parties 1..parties
+  return Compiler().compile(source, parties)
+
+# ---------------------------------------------------------------------------
+
+if __name__ == '__main__':
+  compiler = Compiler()
+  gates = compiler.compile(sys.argv[1])
+  for g, entry in gates.items():
+    print(f'{g:4}: ({NAMES[entry[0]]}, {", ".join(map(str, entry[1:]))})')
+  print(f'{compiler.n_gates} gates, multiplicative depth {compiler.depth}')
@@ -7,8 +7,8 @@ VERBOSE = 1  # 0=quiet, 1+=increasing verbosity
 # set to True to use party no as seed, useful for debugging (mpc.py)
 REPEATABLE_RANDOM_NUMBERS = False
 
-# optional - set to True if you write a non-distributed (non-multiprocess) 
-#   version and wish to test (mpc.py)
+# set to True to evaluate the circuit for all parties in a single process
+#   with numpy instead of spawning party processes (mpc.py, local.py)
 LOCAL = False
 
 # ---------------------------------------------------------------------------
@@ -20,11 +20,70 @@ LOCAL = False
 #   high LOCAL_PORT and pass as a parameter when parties are created.
 LOCAL_PORT = 12340
 
+# party daemons take jobs on CONTROL_PORT+PartyNo (daemon.py), parties
+#   report their results to mpc.py on CONTROL_PORT itself
+CONTROL_PORT = 13340
+
+# JSON manifest of party host:port endpoints, to place parties on several
+#   hosts (endpoints.py) - None puts every party on localhost at
+#   LOCAL_PORT+PartyNo
+ENDPOINTS = None
+
+# how parties exchange shares (network.py)
+#   'p2p'    - direct ROUTER/DEALER sockets per peer with a readiness barrier
+#   'pubsub' - original PUB/SUB sockets, waits SYNC_DELAY for slow joiners
+#   'shm'    - shared memory ring buffers, all parties on one x86 host (ring.py)
+TRANSPORT = 'p2p'
+# bytes in each ring buffer when TRANSPORT is 'shm', one per ordered pair of
+#   parties - bigger messages are written in pieces
+RING_SIZE = 1 << 20
+
+# how MUL and DOT gates are evaluated (party.py)
+#   'bgw'    - every party reshares its local product (degree reduction)
+#   'beaver' - open masked values against multiplication triples generated
+#              beforehand with 'make offline' (beaver.py)
+#   'dn'     - Damgard-Nielsen: mask products with double random sharings and
+#              have the KING party open them, O(N) messages per MUL layer
+MUL_PROTOCOL = 'bgw'
+
+# how parties step through the circuit (party.py, async_party.py)
+#   'layers' - one multiplicative layer at a time, one round per layer
+#   'async'  - asyncio dataflow, each gate runs as soon as its inputs are ready
+ENGINE = 'layers'
+
+# how arrays of field elements are stored and multiplied (modprime.py)
+#   'auto', 'int64', 'uint64' (PRIME < 2^62 - the reduced product can be
+#   off by up to p either way and must fit a signed 64 bit word - and a
+#   64 bit long double mantissa, so not MSVC or Apple arm64), 'gmpy2' or
+#   'python'
+FIELD = 'auto'
+
+# pseudo-random secret sharing - derive DN double sharings and the a, b of
+#   Beaver triples locally from PRG seeds shared by every N-T parties, after
+#   a one round setup. C(N, T) seeds, so keep N small (prss.py)
+PRSS = False
+
+# party that opens masked products when MUL_PROTOCOL is 'dn' - must be one
+#   of the circuit's parties (circuit.py)
+KING = 1
+
+# packed secret sharing - in batch mode, number of records whose secrets
+#   share one polynomial of degree T+PACKING-1. Needs 2(T+PACKING-1) < N
+#   and MUL_PROTOCOL 'bgw' (modprime.py, party.py)
+PACKING = 1
+
+# each party's multiplication triples - {} is the party number, the runs
+#   already used are counted in a .json file next to it (beaver.py)
+TRIPLES_FILE = 'triples/party_{:02}.npy'
+# number of circuit evaluations 'make offline' generates triples for
+OFFLINE_RUNS = 10
+
 # increase following two timeouts if running on a slow or overloaded machine
-#   all parties will be terminated after this number of seconds (mpc.py)
+#   mpc.py returns as soon as every party has finished, parties still
+#   running after this number of seconds are terminated (mpc.py)
 MAX_TIME = 5
 # each party will sleep for this number of seconds before connecting to other
-#   parties (network.py)
+#   parties when TRANSPORT is 'pubsub' (network.py)
 SYNC_DELAY = 2
 
 # pkill pattern - used to kill zombie or runaway processes (Makefile, mpc.py)
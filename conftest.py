@@ -0,0 +1,75 @@
+# shared pytest fixtures - the modules that size themselves from PRIME and
+# FIELD at import are reloaded to test other primes and backends
+#
+#   python3 -m pytest
+
+import importlib # reload
+
+import numpy as np
+import pytest
+
+import beaver
+import circuit
+import codec
+import config
+import modprime
+import prg
+import prss
+import wiring
+
+def reload_field(prime, field='auto'):
+  circuit.PRIME, config.FIELD = prime, field
+  importlib.reload(prg)
+  importlib.reload(modprime)
+  importlib.reload(codec)
+  importlib.reload(wiring)
+  importlib.reload(prss)
+  importlib.reload(beaver)
+  return modprime
+
+@pytest.fixture
+def reload():
+  # reload_field, with the circuit's own prime and field put back after
+  prime, field = circuit.PRIME, config.FIELD
+  yield reload_field
+  reload_field(prime, field)
+
+# ---------------------------------------------------------------------------
+# protocol steps run for every party in one process
+
+class Mailbox():
+  # stands in for a party's network - what it sends is kept for the test
+  # to hand to the receivers
+
+  def __init__(self):
+    self.sent = {}
+
+  def send_share(self, share, gate, party):
+    self.sent[(party, gate)] = share
+
+  def flush(self):
+    pass
+
+def open_shares(shares, degree):
+  # the secret of {party: share} as ints, or None unless every degree+1
+  # consecutive parties agree on it - which they all do only if the shares
+  # lie on one polynomial of at most that degree
+  points = sorted(shares)
+  secrets = [np.ravel(modprime.reconstruct({p: shares[p] for p in points[i:i+degree+1]},
+                                           degree)).tolist()
+             for i in range(len(points) - degree)]
+  if any(secret != secrets[0] for secret in secrets):
+    return None
+  secret = [int(v) for v in secrets[0]]
+  return secret if np.ndim(shares[points[0]]) else secret[0]
+
+def deal_prss():
+  # every party's Prss, with the seeds dealt as setup_prss would
+  parties = {p: prss.Prss(p) for p in circuit.ALL_PARTIES}
+  mail = {p: Mailbox() for p in circuit.ALL_PARTIES}
+  for p, party in parties.items():
+    party.deal(mail[p])
+  for p, party in parties.items():
+    for leader in party.leaders:
+      party.accept(leader, mail[leader].sent[(p, 0)])
+  return parties
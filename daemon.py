@@ -0,0 +1,160 @@
+# persistent party daemons
+#
+# each party starts once, connects its network and then evaluates a stream
+# of jobs over it, so process start up and socket set up are paid once
+# instead of per evaluation. a client sends every party its
+# input for a job on the party's control socket (CONTROL_PORT+PartyNo, or
+# as placed by the ENDPOINTS manifest, see endpoints.py) and
+# gets the opened result back. jobs carry increasing session ids that also
+# tag their shares on the transport, so a party that runs ahead into the
+# next job never mixes its shares up with the last job's
+#
+#   python3 mpc.py daemon     start the party daemons
+#   python3 mpc.py jobs 100   run 100 jobs with random inputs, check results
+#   python3 mpc.py stop       stop the party daemons
+#
+# daemons evaluate the circuit they were started with, a job for another
+# circuit gets an error reply
+
+import json   # dumps, loads
+import random # randrange
+import time   # perf_counter, time_ns
+import zmq    # Context
+
+import log
+
+from beaver  import RESERVE, Triples, triples_needed
+from circuit import ALL_PARTIES, BATCH, CIRCUIT, PRIME, function
+from config  import MAX_TIME, MUL_PROTOCOL, PRSS
+from endpoints import bind_address, connect_address
+from party   import BgwProtocol
+from prss    import setup_prss
+
+# ---------------------------------------------------------------------------
+
+def serve(party_no, network):
+  # run jobs in the order they arrive until told to stop - a job whose
+  # shares stop arriving fails after MAX_TIME rather than blocking the rest
+  network.timeout = MAX_TIME
+  # PRSS seeds are dealt once, in session 0 before any job, and kept for
+  # every job
+  prss = setup_prss(party_no, network) if PRSS and MUL_PROTOCOL == 'dn' else None
+  # the triple store is opened once too, and reserves runs in blocks
+  store = Triples(party_no, RESERVE) if MUL_PROTOCOL == 'beaver' and triples_needed() else None
+  control = zmq.Context().socket(zmq.ROUTER)
+  control.bind(bind_address(party_no, control=True))
+  log.write(f'Party {party_no} waiting for jobs')
+  while True:
+    identity, msg = control.recv_multipart()
+    job = json.loads(msg)
+    if job.get('stop'):
+      reply = {'party': party_no, 'stopped': True}
+    else:
+      reply = run_job(party_no, network, job, prss, store)
+    control.send_multipart([identity, json.dumps(reply).encode()])
+    if job.get('stop'):
+      break
+  control.close(linger=1000)
+
+def check_input(value):
+  # a field element, or a list of BATCH of them
+  values = value if BATCH else [value]
+  if BATCH and not (isinstance(value, list) and len(value) == BATCH):
+    raise ValueError(f'Input must be a list of {BATCH} values')
+  if not all(isinstance(v, int) and 0 <= v < PRIME for v in values):
+    raise ValueError(f'Input values must be ints in [0, {PRIME})')
+
+def run_job(party_no, network, job, prss=None, store=None):
+  reply = {'party': party_no, 'session': job['session']}
+  if job['circuit'] != CIRCUIT:
+    reply['error'] = f'Party is running circuit {CIRCUIT}'
+    return reply
+  try:
+    network.start_session(job['session'])
+  except ValueError as error:
+    reply['error'] = str(error)
+    return reply
+
+  start = time.perf_counter()
+  try:
+    check_input(job['input'])
+    if prss:
+      prss.start_session(job['session'])
+    protocol = BgwProtocol(party_no, job['input'], network, expected=None, prss=prss, store=store)
+  except Exception as error:
+    # a bad input, or peers whose shares never came - drop the session and
+    # carry on with the next job
+    network.abandon_session()
+    reply['error'] = f'{type(error).__name__}: {error}'
+    return reply
+  reply['result'] = protocol.result
+  reply['seconds'] = time.perf_counter() - start
+  return reply
+
+# ---------------------------------------------------------------------------
+
+def connect():
+  context = zmq.Context()
+  sockets = {}
+  for p in ALL_PARTIES:
+    sockets[p] = context.socket(zmq.DEALER)
+    sockets[p].setsockopt(zmq.LINGER, 0)
+    sockets[p].connect(connect_address(p, control=True))
+  return sockets
+
+def collect(sockets, count):
+  # count replies from the parties, or as many as arrive before a silence
+  # longer than daemons wait for a share, so their timeout replies get here
+  poller = zmq.Poller()
+  for socket in sockets.values():
+    poller.register(socket, zmq.POLLIN)
+  replies = []
+  while len(replies) < count:
+    ready = dict(poller.poll(2 * MAX_TIME * 1000))
+    if not ready:
+      break
+    for socket in ready:
+      replies.append(json.loads(socket.recv()))
+  return replies
+
+def random_inputs():
+  def value():
+    if BATCH:
+      return [random.randrange(PRIME) for _ in range(BATCH)]
+    return random.randrange(PRIME)
+  return {p: value() for p in ALL_PARTIES}
+
+def expected_result(inputs):
+  if BATCH:
+    return [function({p: v[r] for p, v in inputs.items()}) for r in range(BATCH)]
+  return function(inputs)
+
+def run_jobs(count):
+  # send count jobs to every party up front, so the daemons never wait for
+  # the client, then check every party's result for every job
+  sockets = connect()
+  base = time.time_ns() // 1000     # ids increase across client runs
+  jobs = {base + k: random_inputs() for k in range(count)}
+
+  start = time.perf_counter()
+  for session, inputs in jobs.items():
+    for p in ALL_PARTIES:
+      job = {'session': session, 'circuit': CIRCUIT, 'input': inputs[p]}
+      sockets[p].send(json.dumps(job).encode())
+  replies = collect(sockets, count * len(ALL_PARTIES))
+  elapsed = time.perf_counter() - start
+
+  expected = {session: expected_result(inputs) for session, inputs in jobs.items()}
+  correct = sum(reply.get('result') == expected[reply['session']] for reply in replies)
+  for reply in replies:
+    if 'error' in reply:
+      print(f"Party {reply['party']} session {reply['session']}: {reply['error']}")
+  print(f'{count} jobs in {elapsed:.3f}s, {count/elapsed:.1f} jobs/s - '
+        f'{correct} of {count * len(ALL_PARTIES)} party results correct')
+
+def stop_daemons():
+  sockets = connect()
+  for socket in sockets.values():
+    socket.send(json.dumps({'stop': True}).encode())
+  stopped = collect(sockets, len(sockets))
+  print(f'Stopped {len(stopped)} of {len(sockets)} parties')
@@ -0,0 +1,99 @@
+# where parties run (config.ENDPOINTS)
+#
+# a manifest is a JSON file mapping party numbers to host:port, e.g.
+#
+#   {"1": "127.0.0.1:12341", "2": "127.0.0.2:12341", "3": "node2:12341",
+#    "4": {"endpoint": "127.0.0.4:12340", "control": 14340}}
+#
+# every party binds its own endpoint and connects to everyone else's, and
+# mpc.py starts the parties whose host is an address of the machine it runs
+# on - run it on every host. a party's daemon control socket is on the same
+# host, CONTROL_PORT-LOCAL_PORT above its port unless "control" says
+# otherwise. mpc.py collects reports on 127.0.0.1:CONTROL_PORT, so sockets
+# bound on this machine must not clash with that or each other. without a
+# manifest every party is on localhost at LOCAL_PORT+PartyNo
+#
+#   python3 mpc.py manifest FILE HOST...   parties round robin on the hosts
+
+import ipaddress # ip_address
+import json      # dump, load
+import socket    # socket
+
+from circuit import ALL_PARTIES
+from config  import CONTROL_PORT, ENDPOINTS, LOCAL_PORT
+
+# a daemon's control socket is this far above its party's port by default
+CONTROL_OFFSET = CONTROL_PORT - LOCAL_PORT
+
+# where parties on this machine report to mpc.py
+REPORT_ADDRESS = f'tcp://127.0.0.1:{CONTROL_PORT}'
+
+# ---------------------------------------------------------------------------
+
+def parse(entry):
+  # (host, port, control port) of "host:port" or {"endpoint": .., "control": ..}
+  if isinstance(entry, dict):
+    host, port, _control = parse(entry['endpoint'])
+    return host, port, int(entry['control'])
+  host, port = entry.rsplit(':', 1)
+  return host, int(port), int(port) + CONTROL_OFFSET
+
+def is_local(host):
+  # an address of this machine if we can bind to it
+  try:
+    with socket.socket() as probe:
+      probe.bind((host, 0))
+    return True
+  except OSError:
+    return False
+
+def bind_host(host):
+  # an IP address is bound as is, so parties on 127.0.0.x can share ports,
+  # otherwise every interface
+  try:
+    ipaddress.ip_address(host)
+    return host
+  except ValueError:
+    return '*'
+
+def check_ports(manifest, local):
+  # the sockets bound on this machine - launcher, shares and control - need
+  # their own port, or the same port on different addresses
+  bound = {CONTROL_PORT: ['127.0.0.1']}
+  for p in local:
+    host, port, control = manifest[p]
+    bound.setdefault(port, []).append(bind_host(host))
+    bound.setdefault(control, []).append(bind_host(host))
+  for port, hosts in bound.items():
+    clash = len(set(hosts)) < len(hosts) or (len(hosts) > 1 and '*' in hosts)
+    assert not clash, f"Sockets clash on port {port} in {ENDPOINTS} :-("
+
+def load_endpoints():
+  if ENDPOINTS is None:
+    return {p: ('localhost', LOCAL_PORT+p, CONTROL_PORT+p) for p in ALL_PARTIES}
+  with open(ENDPOINTS) as file:
+    manifest = {int(p): parse(entry) for p, entry in json.load(file).items()}
+  missing = [p for p in ALL_PARTIES if p not in manifest]
+  assert not missing, f"No endpoints for parties {missing} in {ENDPOINTS} :-("
+  return manifest
+
+ENDPOINT = load_endpoints()
+
+# parties mpc.py starts on this machine
+LOCAL_PARTIES = [p for p in ALL_PARTIES if is_local(ENDPOINT[p][0])]
+check_ports(ENDPOINT, LOCAL_PARTIES)
+
+def bind_address(party_no, control=False):
+  host, port, control_port = ENDPOINT[party_no]
+  return f'tcp://{bind_host(host)}:{control_port if control else port}'
+
+def connect_address(party_no, control=False):
+  host, port, control_port = ENDPOINT[party_no]
+  return f'tcp://{host}:{control_port if control else port}'
+
+def write_manifest(filename, hosts):
+  # place parties round robin on hosts, each at LOCAL_PORT+PartyNo
+  manifest = {str(p): f'{hosts[(p-1) % len(hosts)]}:{LOCAL_PORT+p}' for p in ALL_PARTIES}
+  with open(filename, 'w') as file:
+    json.dump(manifest, file, indent=2)
+  print(f'Wrote {len(manifest)} party endpoints to {filename}')
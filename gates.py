@@ -0,0 +1,22 @@
+# Gate types - shared by circuit.py and the circuit compiler
+INP, ADD, MUL = (0,1,2)
+
+# Public constant gates, evaluated locally with no network traffic
+#   (SUB, dest, leg)      - leg 1 minus leg 2
+#   (NEG, dest, leg)      - negate
+#   (ADDC, dest, leg, c)  - add public constant c
+#   (MULC, dest, leg, c)  - multiply by public constant c
+SUB, NEG, ADDC, MULC = (3,4,5,6)
+
+# Fused inner product - sum of the products of legs (1,2), (3,4), ...
+#   with a single degree reduction for the whole sum
+DOT = 7
+
+# Gates that need no communication
+LINEAR = (ADD, SUB, NEG, ADDC, MULC)
+
+# Gates whose local product has degree 2T and needs a degree reduction
+PRODUCTS = (MUL, DOT)
+
+NAMES = {INP: 'INP', ADD: 'ADD', MUL: 'MUL', SUB: 'SUB', NEG: 'NEG',
+         ADDC: 'ADDC', MULC: 'MULC', DOT: 'DOT'}
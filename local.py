@@ -0,0 +1,112 @@
+# non-distributed circuit evaluation (config.LOCAL) - runs BGW for all parties
+# in one process. Every wire holds an array of shape (parties, batch) with
+# one row per party's share, so sharing and reconstruction become matrix
+# products with the precomputed power matrix and Lagrange coefficients
+
+import time   # perf_counter
+
+import numpy as np
+
+import log
+import modprime
+
+from circuit import (ALL_PARTIES, BATCH, DEGREE, FUNCTION_RESULT, INP, LINEAR,
+                     N_PARTIES, PRIVATE_VALUES, PRODUCTS)
+from config  import MUL_PROTOCOL, PRSS, REPEATABLE_RANDOM_NUMBERS
+from modprime import DTYPE, PACKED_DEGREE, lagrange, matmul, share
+from wiring  import WIRING, linear_gate, local_product
+
+# ---------------------------------------------------------------------------
+
+# reconstruction from the first T+1 shares, degree reduction from the first
+# 2T+1 - the same point sets used by BgwProtocol
+LAGRANGE_T  = np.array(lagrange(tuple(range(1, DEGREE+2))), dtype=DTYPE)
+LAGRANGE_2T = np.array(lagrange(tuple(range(1, 2*DEGREE+2))), dtype=DTYPE)
+
+def reconstruct(shares):
+  # recover the (batch,) secrets from (parties, batch) shares
+  return matmul(LAGRANGE_T, shares[:DEGREE+1])
+
+def reduce_degree(products):
+  # BGW degree reduction of (parties, batch) degree-2T shares: the first
+  # 2T+1 parties reshare their products, every party combines the
+  # subshares it receives with the degree-2T Lagrange coefficients
+  subshares = share(products[:2*DEGREE+1])       # (receiver, sender, batch)
+  return matmul(subshares.transpose(0, 2, 1), LAGRANGE_2T)
+
+# the rounds and messages the distributed run would need - a message is
+# everything one party flushes to another, shares to ourselves are free
+
+def mul_layer_cost():
+  # (rounds, messages) for one layer of MUL gates
+  if MUL_PROTOCOL == 'beaver':
+    return 1, N_PARTIES * (N_PARTIES-1)    # everyone opens d and e
+  if MUL_PROTOCOL == 'dn':
+    return 2, 2 * (N_PARTIES-1)            # to the king and back
+  dealers = 2*PACKED_DEGREE + 1            # the first 2T+1 reshare
+  return 1, dealers * (N_PARTIES-1)
+
+def doubles_cost():
+  # (rounds, messages) for dealing DN double sharings or PRSS seeds
+  if MUL_PROTOCOL != 'dn' or not any(WIRING.types[g] in PRODUCTS for g in WIRING.gates):
+    return 0, 0
+  if PRSS:
+    # each set's leader, its lowest party, sends its seeds to the other
+    # members, one message per member. party l leads a set of N-T if at
+    # least N-T parties are numbered l or more, and then shares one with
+    # every party above it
+    return 1, sum(N_PARTIES - l for l in range(1, DEGREE+2))
+  return 1, N_PARTIES * (N_PARTIES-1)
+
+def simulate_parties():
+  log.init_logging(0)
+  if REPEATABLE_RANDOM_NUMBERS:
+    modprime.seed(0)
+  start = time.perf_counter()
+
+  # scalar inputs are a batch of one record
+  secrets = {p: np.atleast_1d(modprime.array(PRIVATE_VALUES[p]))
+             for p in ALL_PARTIES}
+  wires = {}
+  rounds, messages = doubles_cost()
+
+  for layer in WIRING.layers:
+    inp_gates = [gate for gate in layer if WIRING.types[gate] == INP]
+    for gate in inp_gates:
+      wires[gate] = share(secrets[gate])
+    if inp_gates:
+      rounds += 1
+      messages += len(inp_gates) * (N_PARTIES-1)
+
+    mul_gates = [gate for gate in layer if WIRING.types[gate] in PRODUCTS]
+    for gate in mul_gates:
+      inputs = [wires[src] for src in WIRING.sources[gate]]
+      wires[gate] = reduce_degree(local_product(inputs))
+    if mul_gates:
+      layer_rounds, layer_messages = mul_layer_cost()
+      rounds += layer_rounds
+      messages += layer_messages
+
+    for gate in layer:
+      if WIRING.types[gate] in LINEAR:
+        inputs = [wires[src] for src in WIRING.sources[gate]]
+        wires[gate] = linear_gate(WIRING.types[gate], inputs,
+                                  WIRING.constants.get(gate))
+
+  secret = reconstruct(wires[WIRING.output]).tolist()
+  rounds += 1
+  messages += N_PARTIES * (N_PARTIES-1)
+
+  log.write(f'{len(WIRING.gates)} gates, {len(WIRING.layers)-1} MUL layers, '
+            f'{rounds} rounds, {messages} messages, '
+            f'{time.perf_counter()-start:.3f}s')
+  if BATCH:
+    correct = sum(s == r for s, r in zip(secret, FUNCTION_RESULT))
+    if correct == BATCH:
+      log.write(f'SUCCESS! The secrets of all {BATCH} records were calculated.')
+    else:
+      log.write(f'FAIL! Only {correct} of {BATCH} records were calculated correctly')
+  elif secret[0] == FUNCTION_RESULT:
+    log.write(f'SUCCESS! The secret of {secret[0]} was calculated.')
+  else:
+    log.write(f'FAIL! We calculated {secret[0]}, but the correct value was {FUNCTION_RESULT}')
@@ -2,11 +2,64 @@
 # naranker dulay, dept of computing, imperial college, october 2020
 
 # arithmetic modulo a prime number
+#
+# scalars are python ints, batches are numpy arrays whose element type
+# depends on the field backend (config.FIELD):
+#   'int64'  - products and dot products over all parties can't overflow
+#   'uint64' - primes < 2^62, products are reduced with a long double
+#              estimate of the quotient (needs a 64 bit long double mantissa).
+#              the remainder is then in (-p, 2p), which only fits an int64
+#              word for p < 2^62, so primes up to 2^63 can't use it
+#   'gmpy2'  - arrays of gmpy2 mpz, any prime (optional dependency)
+#   'python' - arrays of python ints, any prime
+# 'auto' picks int64 or uint64 if PRIME allows, otherwise python ints up to
+# 512 bits, where gmpy2 starts to win over the cost of numpy object dispatch
 
-import functools # reduce
-import random    # randint
+import functools # reduce, lru_cache
+import operator  # mul
 
-from circuit import PRIME
+import numpy as np
+
+try:
+  import gmpy2   # mpz, invert
+except ImportError:
+  gmpy2 = None
+
+from circuit import ALL_PARTIES, BATCH, DEGREE, N_PARTIES, PRIME
+from config  import FIELD, MUL_PROTOCOL, PACKING
+from prg     import Pool, replay_seed
+
+# ---------------------------------------------------------------------------
+
+def fits_uint64():
+  return PRIME < 2**62 and np.finfo(np.longdouble).nmant >= 63
+
+def pick_field():
+  if (PRIME-1)**2 * (N_PARTIES+1) < 2**63:
+    return 'int64'
+  if fits_uint64():
+    return 'uint64'
+  return 'gmpy2' if gmpy2 and PRIME.bit_length() > 512 else 'python'
+
+BACKEND = pick_field() if FIELD == 'auto' else FIELD
+assert BACKEND != 'int64' or pick_field() == 'int64', "int64 field would overflow :-("
+assert BACKEND != 'gmpy2' or gmpy2, "gmpy2 is not installed :-("
+assert BACKEND != 'uint64' or fits_uint64(), "uint64 field needs PRIME < 2^62 and a 64 bit long double :-("
+
+DTYPE = {'int64': np.int64, 'uint64': np.uint64}.get(BACKEND, object)
+
+def is_word_array(a):
+  # uint64 values whose products would wrap around
+  return BACKEND == 'uint64' and isinstance(a, (np.ndarray, np.generic))
+
+def mulmod64(a, b):
+  # a*b mod p for uint64 arrays - the long double quotient is out by at
+  # most one, so the wrapped remainder lies in (-p, 2p) and fits an int64
+  a, b = np.asarray(a, np.uint64), np.asarray(b, np.uint64)
+  q = (a.astype(np.longdouble) * b.astype(np.longdouble) / PRIME).astype(np.uint64)
+  r = (a * b - q * np.uint64(PRIME)).view(np.int64)
+  r = np.where(r < 0, r + PRIME, r)
+  return np.where(r >= PRIME, r - PRIME, r).astype(np.uint64)
 
 # ---------------------------------------------------------------------------
 
@@ -17,20 +70,47 @@ def add(a, b):
   return (a + b) % PRIME
 
 def sub(a, b):
+  if is_word_array(a) or is_word_array(b):
+    return (a + (PRIME - b)) % PRIME   # unsigned, so never go below zero
   return (a - b) % PRIME
 
 def mul(a, b):
+  if is_word_array(a) or is_word_array(b):
+    return mulmod64(a, b)
   return (a * b) % PRIME
 
 def inv(a):
-  # compute multiplicative inverse (mod p) using fermat's little theorem 
-  return pow(a, PRIME-2, PRIME)
+  # compute multiplicative inverse (mod p) using fermat's little theorem,
+  # arrays elementwise with montgomery's trick
+  if isinstance(a, np.ndarray):
+    return batch_inv(a)
+  if gmpy2 and BACKEND == 'gmpy2':
+    return gmpy2.invert(a, PRIME)
+  return pow(int(a), PRIME-2, PRIME)
+
+def batch_inv(values):
+  # montgomery's trick - inverses of all the values with one inversion
+  # and 3(n-1) multiplications. a list gives a list of ints, an array of
+  # the backend gives an array of the same shape
+  if isinstance(values, np.ndarray):
+    return array(batch_inv(values.ravel().tolist())).reshape(values.shape)
+  values = [int(v) for v in values]
+  prefix = [1]
+  for v in values:
+    prefix.append(prefix[-1] * v % PRIME)
+  inverse, inverses = int(inv(prefix[-1])), [0] * len(values)
+  for i in range(len(values) - 1, -1, -1):
+    inverses[i] = inverse * prefix[i] % PRIME
+    inverse = inverse * values[i] % PRIME
+  return inverses
 
 def div(a, b):
   return mul(a, inv(b))
 
 def randint():
-  return random.randint(0, PRIME-1)
+  return int(pool.take(1)[0])
+
+# summation and product work elementwise on arrays as well as on scalars
 
 def summation(list):
   return functools.reduce(add, list)
@@ -38,3 +118,135 @@ def summation(list):
 def product(list):
   return functools.reduce(mul, list)
 
+
+def dot(list1, list2):
+  # single reduction - python ints do not overflow, uint64 words do
+  if BACKEND == 'uint64':
+    return summation(map(mul, list1, list2))
+  return sum(map(operator.mul, list1, list2)) % PRIME
+
+# ---------------------------------------------------------------------------
+
+@functools.lru_cache(maxsize=None)
+def lagrange(points, x=0):
+  # lagrange basis coefficients at x for a tuple of distinct evaluation
+  # points, exact (mod p) - cached since parties reconstruct from the same
+  # point sets over and over
+  nums, dens = [], []
+  for i in points:
+    num, den = 1, 1
+    for j in points:
+      if j != i:
+        num = num * (j - x) % PRIME
+        den = den * (j - i) % PRIME
+    nums.append(num)
+    dens.append(den)
+  return tuple(int(mul(num, d)) for num, d in zip(nums, batch_inv(dens)))
+
+def reconstruct(shares, degree):
+  # recover f(0) of a degree-d polynomial from its first d+1 shares,
+  # shares is a dict {point: f(point)}
+  points = tuple(sorted(shares))[:degree+1]
+  assert len(points) == degree+1, "Too few shares to reconstruct :-("
+  return dot(lagrange(points), [shares[p] for p in points])
+
+# ---------------------------------------------------------------------------
+# batched share generation
+
+# POWERS[j, i] = x_j ** (i+1) mod p for party evaluation points x_j = 1..N,
+# so the shares of secret s with coefficients c are s + POWERS @ c - up to
+# degree 2T, which double sharings need
+POWERS = np.array([[pow(x, i+1, PRIME) for i in range(2*DEGREE)]
+                   for x in ALL_PARTIES], dtype=DTYPE)
+
+# uniform field elements from a seeded PRG (prg.py)
+pool = Pool()
+
+def seed(n):
+  # replay the same randoms on every run, for debugging
+  global pool
+  pool = Pool(replay_seed(n))
+
+def randoms(shape):
+  # array of uniform field elements
+  values = pool.take(int(np.prod(shape)))
+  if DTYPE is object:
+    return array(values.tolist()).reshape(shape)
+  return values.astype(DTYPE).reshape(shape)
+
+if BACKEND == 'gmpy2':
+  MPZ = np.frompyfunc(gmpy2.mpz, 1, 1)
+
+def array(values):
+  if BACKEND == 'uint64':
+    # reduce as signed ints first, values may be negative
+    return (np.asarray(values).astype(np.int64) % PRIME).astype(DTYPE)
+  if BACKEND == 'gmpy2':
+    return np.asarray(MPZ(np.array(values, dtype=object) % PRIME), dtype=object)
+  return np.array(values, dtype=DTYPE) % PRIME
+
+def matmul(a, b):
+  if BACKEND != 'uint64':
+    return (a @ b) % PRIME
+  # one reduced product per term of the contraction, as a @ b would overflow
+  a, b = np.asarray(a, DTYPE), np.asarray(b, DTYPE)
+  result = 0
+  for k in range(a.shape[-1]):
+    if b.ndim == 1:
+      result = add(result, mul(a[..., k], b[k]))
+    else:
+      result = add(result, mul(a[..., k, None], b[..., k, :]))
+  return result
+
+def share(secrets, degree=DEGREE):
+  # split an array of secrets into shares of the given degree with one
+  # batched matrix product, returns array of shape (parties,) + secrets.shape
+  secrets = array(secrets)
+  coefs = randoms((degree,) + secrets.shape)
+  shares = matmul(POWERS[:, :degree], coefs.reshape(degree, -1))
+  return add(shares.reshape((N_PARTIES,) + secrets.shape), secrets)
+
+# ---------------------------------------------------------------------------
+# packed (franklin-yung) sharing - PACKING secrets per polynomial, held at
+# points 0, -1, .. -(PACKING-1), so the polynomial has degree T+PACKING-1
+
+PACKED_POINTS = tuple(-l % PRIME for l in range(PACKING))
+PACKED_DEGREE = DEGREE + PACKING - 1
+
+if PACKING > 1:
+  assert BATCH and MUL_PROTOCOL == 'bgw', "Packing needs batch mode and BGW :-("
+  assert 2*PACKED_DEGREE < N_PARTIES, "2(T+K-1) < N failed :-("
+  assert PRIME > N_PARTIES + PACKING + DEGREE, "Prime > N+K+T failed :-("
+
+# PACK[j, m] maps the values at the secret points followed by DEGREE random
+# points to party j's share
+RANDOM_POINTS = tuple(-(PACKING + r) % PRIME for r in range(DEGREE))
+PACK = np.array([lagrange(PACKED_POINTS + RANDOM_POINTS, x) for x in ALL_PARTIES],
+                dtype=DTYPE)
+
+def unpacking(points):
+  # matrix taking shares at points to the values at the secret points
+  return np.array([lagrange(points, x) for x in PACKED_POINTS], dtype=DTYPE)
+
+def pack_share(blocks):
+  # split an array of blocks of PACKING secrets (last axis) into packed
+  # shares, returns array of shape (parties,) + blocks.shape[:-1]
+  blocks = array(blocks)
+  values = np.concatenate([blocks, randoms(blocks.shape[:-1] + (DEGREE,))], axis=-1)
+  shares = matmul(values.reshape(-1, PACKED_DEGREE+1), PACK.T)
+  return shares.T.reshape((N_PARTIES,) + blocks.shape[:-1])
+
+def unpack(shares, degree):
+  # recover the blocks of secrets from the first degree+1 packed shares,
+  # shares is a dict {point: array}, returns array with blocks on the last axis
+  points = tuple(sorted(shares))[:degree+1]
+  assert len(points) == degree+1, "Too few shares to reconstruct :-("
+  stacked = array([shares[p] for p in points])
+  blocks = matmul(unpacking(points), stacked.reshape(len(points), -1))
+  return blocks.T.reshape(stacked.shape[1:] + (PACKING,))
+
+def to_blocks(vector):
+  # pad a batch vector with zeros and cut it into blocks of PACKING secrets
+  vector = array(vector)
+  padded = np.concatenate([vector, array([0] * (-len(vector) % PACKING))])
+  return padded.reshape(-1, PACKING)
@@ -1,55 +1,170 @@
 # secure multi-party computation, semi-honest case, distributed, v1
 # naranker dulay, dept of computing, imperial college, october 2020
 
-import random     # seed
+import json       # dumps, loads
 import subprocess # Popen
-import sys        # argv
-import time       # sleep
+import sys        # argv, exit
+import time       # perf_counter
+import zmq        # Context
 
-from circuit import ALL_PARTIES, CIRCUIT, N_PARTIES, PRIVATE_VALUES
-from config  import LOCAL, MAX_TIME, PKILL_PATTERN, REPEATABLE_RANDOM_NUMBERS
+from circuit import BATCH, CIRCUIT, N_PARTIES, PRIVATE_VALUES
+from config  import ENGINE, LOCAL, MAX_TIME, PKILL_PATTERN, REPEATABLE_RANDOM_NUMBERS
 from log     import init_logging
 from party   import BgwProtocol
-from network import Network
-
-# from local import simulate_parties
+from beaver  import generate_triples
+from daemon  import run_jobs, serve, stop_daemons
+from endpoints import LOCAL_PARTIES, REPORT_ADDRESS, write_manifest
+from network import AsyncNetwork, Network
+import modprime
 
 # ---------------------------------------------------------------------------
 
-def main():
-  print(f'CIRCUIT {CIRCUIT}')
+def main(mode):
+  print(f'CIRCUIT {CIRCUIT} {mode}')
+  # with an ENDPOINTS manifest, only the parties placed on this host
+  if len(LOCAL_PARTIES) < N_PARTIES:
+    print(f'Starting parties {LOCAL_PARTIES} of {N_PARTIES} on this host')
 
   # create MPC party processes
+  start = time.perf_counter()
   parties = {}
-  for p in ALL_PARTIES:	# to randomise Popens use 'for' on next line instead
-  # for p in random.sample(ALL_PARTIES, k=N_PARTIES):
-    parties[p] = subprocess.Popen(['python3', 'mpc.py', str(p), PKILL_PATTERN],
+  for p in LOCAL_PARTIES:	# to randomise Popens import random, use next line
+  # for p in random.sample(LOCAL_PARTIES, k=len(LOCAL_PARTIES)):
+    parties[p] = subprocess.Popen(['python3', 'mpc.py', str(p), PKILL_PATTERN, mode],
                  bufsize=1, text=True)   # line buffered text output
 
-  # politely terminate all processes after max_time (sends SIGTERM signal)
-  time.sleep(MAX_TIME)
-  for p in ALL_PARTIES:
-    parties[p].terminate()
+  # daemons run until 'python3 mpc.py stop' (daemon.py)
+  if mode == 'daemon':
+    return watch_daemons(parties)
+
+  # parties send their results here as they finish (report_result)
+  reports = zmq.Context().socket(zmq.PULL)
+  reports.bind(REPORT_ADDRESS)
+
+  # wait until every party has exited, MAX_TIME is only a hard timeout.
+  # the others would wait for a party that crashed until then, so stop
+  # waiting as soon as one fails
+  results, finished, crashed = {}, {}, False
+  while (len(finished) < len(LOCAL_PARTIES) and not crashed
+         and time.perf_counter() - start < MAX_TIME):
+    if reports.poll(20):
+      report = json.loads(reports.recv())
+      results[report['party']] = report
+    for p in LOCAL_PARTIES:
+      if p not in finished and parties[p].poll() is not None:
+        finished[p] = time.perf_counter() - start
+        crashed = crashed or parties[p].returncode != 0
+  elapsed = time.perf_counter() - start
+
+  # politely terminate any party still running (sends SIGTERM signal)
+  for p in LOCAL_PARTIES:
+    if p not in finished:
+      parties[p].terminate()
+  # reports that were still in flight when their party exited
+  while len(results) < len(finished) and reports.poll(100):
+    report = json.loads(reports.recv())
+    results[report['party']] = report
+  reports.close(linger=0)
+
+  return summarise(mode, parties, results, finished, elapsed, crashed)
+
+def watch_daemons(parties):
+  # a daemon that fails, e.g. to bind its sockets, would leave the others
+  # waiting forever for it - terminate them all
+  while True:
+    codes = [process.poll() for process in parties.values()]
+    if any(code for code in codes):
+      for process in parties.values():
+        if process.poll() is None:
+          process.terminate()
+      print('A party daemon failed, terminated the others')
+      return False
+    if all(code == 0 for code in codes):
+      return True
+    time.sleep(0.1)
+
+def summarise(mode, parties, results, finished, elapsed, crashed):
+  # one line per party and an overall verdict, True if every party succeeded
+  ok = 0
+  for p in LOCAL_PARTIES:
+    report = results.get(p, {})
+    if p not in finished:
+      status = f'terminated after {elapsed:.3f}s' + (', a party failed' if crashed else '')
+    else:
+      status = f'exit {parties[p].returncode}, {finished[p]:.3f}s'
+    if 'result' in report:
+      status += f", result {report['result']}"
+    if report.get('correct') is not None:
+      status += ', correct' if report['correct'] else ', WRONG'
+    # a party succeeded if it exited cleanly having reported a right result
+    if p in finished and parties[p].returncode == 0 and report and report.get('correct') is not False:
+      ok += 1
+    print(f'party {p:2}: {status}')
+
+  print(f'CIRCUIT {CIRCUIT} {mode}: {ok} of {len(LOCAL_PARTIES)} parties succeeded in {elapsed:.3f}s')
+  return ok == len(LOCAL_PARTIES)
+
+def report_result(party_no, protocol=None):
+  # tell the launcher we're done - batch results are too big to send, so
+  # only whether they were right
+  report = {'party': party_no}
+  if protocol is not None:
+    report['correct'] = protocol.correct
+    if not BATCH:
+      report['result'] = protocol.result
+  socket = zmq.Context().socket(zmq.PUSH)
+  socket.setsockopt(zmq.LINGER, 1000)    # don't hang if mpc.py has gone
+  socket.connect(REPORT_ADDRESS)
+  socket.send(json.dumps(report).encode())
+  socket.close()
 
 # ---------------------------------------------------------------------------
 
 if LOCAL:
   # optional - code for non-distributed circuit evaluation
-  # simulate_parties()
-  pass
-elif len(sys.argv) > 1:
+  from local import simulate_parties
+  simulate_parties()
+elif len(sys.argv) > 3 and sys.argv[2] == PKILL_PATTERN:
   # code for MPC party process
   party_no = int(sys.argv[1])
+  mode = sys.argv[3]
 
   if REPEATABLE_RANDOM_NUMBERS:
-    random.seed(party_no)
+    modprime.seed(party_no)
 
   init_logging(party_no)
-  network = Network(party_no)
-  BgwProtocol(party_no, PRIVATE_VALUES[party_no], network)
+  if mode == 'offline':
+    # preprocessing - input independent, see beaver.py
+    network = Network(party_no)
+    generate_triples(party_no, network)
+    report_result(party_no)
+  elif mode == 'daemon':
+    # evaluate a stream of jobs over one network, see daemon.py
+    network = Network(party_no)
+    serve(party_no, network)
+  elif ENGINE == 'async':
+    from async_party import AsyncBgwProtocol
+    network = AsyncNetwork(party_no)
+    report_result(party_no, AsyncBgwProtocol(party_no, PRIVATE_VALUES[party_no], network))
+  else:
+    network = Network(party_no)
+    report_result(party_no, BgwProtocol(party_no, PRIVATE_VALUES[party_no], network))
+  network.close()
+
+elif sys.argv[1:2] == ['jobs']:
+  # client for the party daemons
+  run_jobs(int(sys.argv[2]) if len(sys.argv) > 2 else 100)
+elif sys.argv[1:2] == ['stop']:
+  stop_daemons()
+elif sys.argv[1:2] == ['manifest']:
+  # placement of parties on hosts, see endpoints.py
+  write_manifest(sys.argv[2], sys.argv[3:] or ['localhost'])
 
 else:
   # code for top-level process - creates and terminates MPC parties
-  main()
+  # 'python3 mpc.py offline' runs the preprocessing phase instead and
+  # 'python3 mpc.py daemon' starts parties that wait for jobs
+  # exit status says whether every party succeeded, so runs can be chained
+  sys.exit(0 if main(sys.argv[1] if len(sys.argv) > 1 else 'online') else 1)
 
 
@@ -3,54 +3,57 @@
 # Radovan, rv20@ic.ac.uk, November 2020
 # Jamie Salter, jas20@ic.ac.uk, November 2020
 
-import collections # deque    # could use a list
-import time   # sleep
+import asyncio     # get_running_loop, wait
+import collections # deque
+import threading   # Condition, Lock, Thread
+import time   # monotonic, sleep
 import zmq    # Context
+import zmq.asyncio # Socket
+import codec
 import log
 
-from circuit import N_GATES, ALL_PARTIES
-from config  import LOCAL_PORT, SYNC_DELAY
+from circuit import ALL_PARTIES
+from config  import SYNC_DELAY, TRANSPORT
+from endpoints import bind_address, connect_address
+from ring    import SPIN, X86, Ring
+
+# receives give up after this many ms so the receiver thread can stop
+RECEIVE_TIMEOUT = 100
 
 # ---------------------------------------------------------------------------
 
+def topic(party_no):
+  # fixed width so that subscription prefixes can't match other parties
+  return party_no.to_bytes(2, 'big')
+
 class Publisher():
   def __init__(self, party_no):
     self.party_no = party_no
     self.socket = zmq.Context().socket(zmq.PUB)
-    self.socket.bind(f'tcp://*:{LOCAL_PORT+party_no}')
+    self.socket.bind(bind_address(party_no))
 
-  def send(self, dest, msg):
-    # send message (pickled object) to destination party
-    self.socket.send_string(f'{dest:02}', flags=zmq.SNDMORE)
-    self.socket.send_pyobj(self.party_no, flags=zmq.SNDMORE)
-    self.socket.send_pyobj(msg)
+  def send(self, dest, items, session=0):
+    # send batch of (gate, share) pairs to destination party in one message
+    self.socket.send_multipart([topic(dest), codec.encode(self.party_no, items, session)])
 
 class Subscriber():
   def __init__(self, party_no):
     self.party_no = party_no
     self.socket = zmq.Context().socket(zmq.SUB)
-    self.socket.setsockopt_string(zmq.SUBSCRIBE, f'{party_no:02}')
-    self.queues = {p: collections.deque() for p in ALL_PARTIES}
+    self.socket.setsockopt(zmq.SUBSCRIBE, topic(party_no))
+    self.socket.setsockopt(zmq.RCVTIMEO, RECEIVE_TIMEOUT)
     for p in ALL_PARTIES:
-       self.socket.connect(f'tcp://localhost:{LOCAL_PORT+p}')
-
-  def receive(self, sender):
-    # return next message from sender, keep receiving messages until 
-    # match, queue any messages from other senders
-    if self.queues[sender]:
-      return self.queues[sender].popleft()
-    while True:
-      _our_party_no = self.socket.recv_string()
-      msg_sender = self.socket.recv_pyobj()
-      msg = self.socket.recv_pyobj()
-      if msg_sender == sender:
-        return msg
-      self.queues[msg_sender].append(msg)
+       self.socket.connect(connect_address(p))
 
-# ---------------------------------------------------------------------------
+  def receive(self):
+    # return (sender, session, [(gate, share), ...]) for the next message
+    # from any party
+    _our_topic, msg = self.socket.recv_multipart()
+    return codec.decode(msg)
 
-class Network():
-  # networking - for sending and receiving shares between parties
+class PubSub():
+  # original transport - every party publishes on its own TCP port and
+  # subscribes to everyone else's, relying on sleeps to avoid slow joiners
 
   def __init__(self, party_no):
     # create party's TCP port
@@ -61,33 +64,349 @@ class Network():
     self.subscriber = Subscriber(party_no)
     # wait for other parties to connect to this party
     time.sleep(1)
-    # create buffer for received shares
-    self.shares = {p: {g: None for g in range(1, N_GATES+2)}
-                   for p in ALL_PARTIES}
+    # receiving socket and raw messages already read from it, as for p2p
+    self.socket = self.subscriber.socket
+    self.pending = collections.deque()
+
+  def send(self, dest, items, session=0):
+    self.publisher.send(dest, items, session)
+
+  def receive(self):
+    return self.subscriber.receive()
+
+  def close(self):
+    pass
+
+class PeerToPeer():
+  # point-to-point transport - each party receives on a ROUTER socket and
+  # sends to each peer on its own DEALER socket. DEALERs queue messages until
+  # the peer is connected, so nothing depends on sleep timing
+
+  def __init__(self, party_no):
+    self.party_no = party_no
+    context = zmq.Context()
+    self.router = self.socket = context.socket(zmq.ROUTER)
+    self.router.bind(bind_address(party_no))
+    self.dealers = {}
+    for p in ALL_PARTIES:
+      if p != party_no:
+        self.dealers[p] = context.socket(zmq.DEALER)
+        self.dealers[p].setsockopt(zmq.IDENTITY, topic(party_no))
+        self.dealers[p].connect(connect_address(p))
+    # messages from peers that got through the barrier before us
+    self.pending = collections.deque()
+    self.barrier()
+    self.router.setsockopt(zmq.RCVTIMEO, RECEIVE_TIMEOUT)
+
+  def barrier(self):
+    # tell every peer we're ready, then wait until every peer has said the
+    # same - an empty message is a ready signal, never a batch of shares
+    for dealer in self.dealers.values():
+      dealer.send(b'')
+    waiting = set(self.dealers)
+    while waiting:
+      identity, msg = self.router.recv_multipart()
+      if msg:
+        self.pending.append(msg)
+      else:
+        waiting.discard(int.from_bytes(identity, 'big'))
+    log.debug(f"All {len(self.dealers)} peers ready", 2)
+
+  def send(self, dest, items, session=0):
+    self.dealers[dest].send(codec.encode(self.party_no, items, session))
+
+  def receive(self):
+    if self.pending:
+      return codec.decode(self.pending.popleft())
+    _identity, msg = self.router.recv_multipart()
+    return codec.decode(msg)
+
+  def close(self):
+    pass
+
+class SharedRings():
+  # single host transport - a shared memory ring buffer per ordered pair of
+  # parties instead of sockets, see ring.py. messages are the same codec
+  # bytes as on the sockets, each after a 4 byte length
+
+  def __init__(self, party_no):
+    assert X86, "The shm transport needs an x86 machine :-("
+    self.party_no = party_no
+    peers = [p for p in ALL_PARTIES if p != party_no]
+    self.incoming = {p: Ring.create(p, party_no) for p in peers}
+    self.outgoing = {p: Ring.attach(party_no, p) for p in peers}
+    # bytes read from each ring that don't yet make a whole message
+    self.buffers = {p: bytearray() for p in peers}
+    self.pending = collections.deque()
+    self.barrier()
+
+  def barrier(self):
+    # as for p2p, an empty message says a peer is ready. a ring we attached
+    # to before its receiver replaced a stale one is closed by then, so
+    # attach again and resend
+    for ring in self.outgoing.values():
+      ring.write(bytes(4))
+    waiting = set(self.incoming)
+    while waiting:
+      for p, ring in self.outgoing.items():
+        if ring.closed():
+          ring.close()
+          self.outgoing[p] = Ring.attach(self.party_no, p)
+          self.outgoing[p].write(bytes(4))
+      for p, msg in self.messages():
+        if msg:
+          self.pending.append(msg)
+        else:
+          waiting.discard(p)
+      time.sleep(SPIN)
+    log.debug(f"All {len(self.outgoing)} peers ready", 2)
+
+  def messages(self):
+    # (sender, msg) for every whole message now in the rings
+    for p, ring in self.incoming.items():
+      buffer = self.buffers[p]
+      buffer += ring.read()
+      while len(buffer) >= 4:
+        size = int.from_bytes(buffer[:4], 'big')
+        if len(buffer) < 4 + size:
+          break
+        msg = bytes(buffer[4:4+size])
+        del buffer[:4+size]
+        yield p, msg
+
+  def send(self, dest, items, session=0):
+    msg = codec.encode(self.party_no, items, session)
+    self.outgoing[dest].write(len(msg).to_bytes(4, 'big') + msg)
+
+  def receive(self):
+    # raises zmq.Again after RECEIVE_TIMEOUT ms with nothing, as the sockets do
+    deadline = time.monotonic() + RECEIVE_TIMEOUT / 1000
+    while not self.pending:
+      self.pending.extend(msg for _p, msg in self.messages())
+      if not self.pending:
+        if time.monotonic() > deadline:
+          raise zmq.Again()
+        time.sleep(SPIN)
+    return codec.decode(self.pending.popleft())
+
+  def close(self):
+    for ring in [*self.outgoing.values(), *self.incoming.values()]:
+      ring.close()
+
+def make_transport(party_no):
+  if TRANSPORT == 'p2p':
+    return PeerToPeer(party_no)
+  if TRANSPORT == 'shm':
+    return SharedRings(party_no)
+  return PubSub(party_no)
+
+# ---------------------------------------------------------------------------
+
+class Network():
+  # networking - for sending and receiving shares between parties. A
+  # background thread drains the transport into the share buffer while the
+  # protocol computes, and readers wait on a condition for the gate they need
+
+  def __init__(self, party_no):
+    self.party_no = party_no
+    self.transport = make_transport(party_no)
+    # shares received but not yet read, keyed by (party, gate) - a share is
+    # read once and freed, so only shares in flight take up memory. Each
+    # session (a daemon's job) has its own, self.shares is the current one
+    self.session = 0
+    self.sessions = {0: {}}
+    self.shares = self.sessions[0]
+    # shares queued for each destination party until the next flush
+    self.outgoing = {p: [] for p in ALL_PARTIES}
+    # (session, party, gate) shares that were not needed - dropped when they arrive
+    self.discard = set()
+    # a condition for the gate being waited on, on the lock that guards the
+    # buffer - removed once the wait is over
+    self.lock = threading.Lock()
+    self.arrived = {}
+    # seconds to wait for a share before giving up, None waits for ever
+    self.timeout = None
+    # only the receiver thread reads from the transport from now on
+    self.running = True
+    self.thread = threading.Thread(target=self.receiver, daemon=True)
+    self.thread.start()
+
+  def receiver(self):
+    # buffer the shares of every message as soon as it arrives
+    while self.running:
+      try:
+        msg_sender, session, items = self.transport.receive()
+      except zmq.Again:
+        continue
+      with self.lock:
+        if session < self.session:
+          continue    # late shares of a finished session
+        shares = self.sessions.setdefault(session, {})
+        for msg_gate, msg_share in items:
+          if (session, msg_sender, msg_gate) in self.discard:
+            self.discard.remove((session, msg_sender, msg_gate))
+          else:
+            shares[(msg_sender, msg_gate)] = msg_share
+        if session == self.session:
+          for gate in {msg_gate for msg_gate, _ in items}:
+            if gate in self.arrived:
+              self.arrived[gate].notify_all()
+
+  def start_session(self, session):
+    # switch to a new session - session ids only increase, so shares of
+    # earlier sessions are dropped and later ones may already be buffered
+    if session <= self.session:
+      raise ValueError(f"Session {session} is not after session {self.session} :-(")
+    with self.lock:
+      self.sessions = {s: shares for s, shares in self.sessions.items() if s >= session}
+      self.discard = {key for key in self.discard if key[0] >= session}
+      self.session = session
+      self.shares = self.sessions.setdefault(session, {})
+
+  def abandon_session(self):
+    # forget a failed session - shares buffered or queued for it, shares
+    # still to arrive are dropped by the next start_session
+    with self.lock:
+      self.shares.clear()
+      self.discard = {key for key in self.discard if key[0] != self.session}
+      self.outgoing = {p: [] for p in ALL_PARTIES}
+
+  def close(self):
+    # stop the receiver thread, the transport can't be closed while it reads
+    self.running = False
+    self.thread.join()
+    self.transport.close()
 
   def send_share(self, share, src_gate, dest_party):
-    # send share for gate to destination party
-    self.publisher.send(dest=dest_party, msg=(src_gate,share))
-
-  def receive_share(self, src_party, src_gate, clear = False):
-    # return share from (party:gate), keep receiving shares until 
-    # match, save any shares received from other (party:gate)'s
-    if self.shares[src_party][src_gate] is not None:
-      s = self.shares[src_party][src_gate]
-      if clear:
-        # Once we return a share, remove it to free up any future shares
-        self.shares[src_party][src_gate] = None
-      return s
-
-    while True:   # could use recursion instead
-      msg_gate, msg_share = self.subscriber.receive(src_party)
-      self.shares[src_party][msg_gate] = msg_share
-      if self.shares[src_party][src_gate] is not None:
-        s = self.shares[src_party][src_gate]
-        if clear:
-          # Once we return a share, remove it to free up any future shares
-          self.shares[src_party][src_gate] = None
-        return s
+    # queue share for gate to destination party, shares we send to
+    # ourselves go straight into the buffer
+    if dest_party == self.party_no:
+      with self.lock:
+        self.shares[(dest_party, src_gate)] = share
+    else:
+      self.outgoing[dest_party].append((src_gate, share))
+
+  def flush(self):
+    # send all queued shares, one message per destination party
+    for dest_party, items in self.outgoing.items():
+      if items:
+        self.transport.send(dest_party, items, self.session)
+        self.outgoing[dest_party] = []
+
+  def wait(self, src_gate, predicate):
+    # block until predicate holds for the buffer, called with the lock held
+    arrived = self.arrived.setdefault(src_gate, threading.Condition(self.lock))
+    ready = arrived.wait_for(predicate, self.timeout)
+    del self.arrived[src_gate]
+    if not ready:
+      raise TimeoutError(f"No shares for gate {src_gate} after {self.timeout}s :-(")
+
+  def receive_share(self, src_party, src_gate):
+    # return share from (party:gate) and free it, waiting until the
+    # receiver thread has buffered it
+    with self.lock:
+      self.wait(src_gate, lambda: (src_party, src_gate) in self.shares)
+      return self.shares.pop((src_party, src_gate))
+
+  def receive_any(self, src_parties, src_gate, k):
+    # return {party: share} for the first k of src_parties whose share for
+    # gate arrives, so a slow party doesn't hold up a reconstruction that
+    # only needs k shares
+    def ready():
+      return [p for p in src_parties if (p, src_gate) in self.shares]
+
+    with self.lock:
+      self.wait(src_gate, lambda: len(ready()) >= k)
+      shares = {p: self.shares[(p, src_gate)] for p in ready()[:k]}
+      # free what we used or already have, and drop the rest on arrival
+      for p in src_parties:
+        if self.shares.pop((p, src_gate), None) is None:
+          self.discard.add((self.session, p, src_gate))
+    return shares
+
+# ---------------------------------------------------------------------------
+
+class AsyncNetwork():
+  # asyncio networking (config.ENGINE = 'async') - the receiver task resolves
+  # one future per (party:gate) share, so any number of gates can wait on the
+  # network at once. Queued shares are flushed once per event loop iteration,
+  # so gates that become ready together still share messages
+
+  def __init__(self, party_no):
+    assert TRANSPORT != 'shm', "The async engine needs a socket transport :-("
+    self.party_no = party_no
+    self.transport = make_transport(party_no)
+    # asyncio view of the transport's receiving socket, with no timeout
+    self.socket = zmq.asyncio.Socket.from_socket(self.transport.socket)
+    self.socket.setsockopt(zmq.RCVTIMEO, -1)
+    self.futures = {}
+    self.discard = set()
+    self.outgoing = {p: [] for p in ALL_PARTIES}
+    self.flushing = False
+
+  async def receiver(self):
+    # run as a task for the lifetime of the protocol
+    while self.transport.pending:
+      self.store(*codec.decode(self.transport.pending.popleft()))
+    while True:
+      _identity, msg = await self.socket.recv_multipart()
+      self.store(*codec.decode(msg))
+
+  def store(self, sender, _session, items):
+    # a single session, the protocol's event loop lasts for one circuit
+    for gate, share in items:
+      if (sender, gate) in self.discard:
+        self.discard.remove((sender, gate))
+      else:
+        self.future(sender, gate).set_result(share)
+
+  def future(self, party, gate):
+    if (party, gate) not in self.futures:
+      self.futures[(party, gate)] = asyncio.get_running_loop().create_future()
+    return self.futures[(party, gate)]
+
+  def close(self):
+    # the receiver task ends with the protocol's event loop
+    pass
+
+  def send_share(self, share, src_gate, dest_party):
+    # queue share for gate to destination party, flushed after every gate
+    # that is ready now has run
+    if dest_party == self.party_no:
+      self.store(dest_party, 0, [(src_gate, share)])
+    else:
+      self.outgoing[dest_party].append((src_gate, share))
+      if not self.flushing:
+        self.flushing = True
+        asyncio.get_running_loop().call_soon(self.flush)
+
+  def flush(self):
+    # send all queued shares, one message per destination party
+    self.flushing = False
+    for dest_party, items in self.outgoing.items():
+      if items:
+        self.transport.send(dest_party, items)
+        self.outgoing[dest_party] = []
 
+  async def receive_share(self, src_party, src_gate):
+    # every share is read once, so it's removed from the buffer
+    share = await self.future(src_party, src_gate)
+    del self.futures[(src_party, src_gate)]
+    return share
 
+  async def receive_any(self, src_parties, src_gate, k):
+    # {party: share} for the first k of src_parties whose share arrives,
+    # the rest are dropped when they arrive
+    futures = {p: self.future(p, src_gate) for p in src_parties}
+    waiting = set(futures.values())
+    while len(futures) - len(waiting) < k:
+      _done, waiting = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
 
+    shares = {}
+    for p, future in futures.items():
+      del self.futures[(p, src_gate)]
+      if not future.done():
+        self.discard.add((p, src_gate))
+      elif len(shares) < k:
+        shares[p] = future.result()
+    return shares
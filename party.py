@@ -6,172 +6,376 @@ import subprocess # Popen
 import sys        # argv
 import time       # sleep
 import math
-from collections import defaultdict
 
-from circuit import ALL_PARTIES, CIRCUIT, N_PARTIES, PRIVATE_VALUES, GATES, INP, ADD, MUL, PRIME, FUNCTION_RESULT, DEGREE
-from config  import LOCAL, MAX_TIME, PKILL_PATTERN, REPEATABLE_RANDOM_NUMBERS
+from circuit import ALL_PARTIES, BATCH, CIRCUIT, N_PARTIES, PRIVATE_VALUES, INP, LINEAR, PRODUCTS, PRIME, FUNCTION_RESULT, DEGREE
+from config  import KING, LOCAL, MAX_TIME, MUL_PROTOCOL, PACKING, PKILL_PATTERN, PRSS, REPEATABLE_RANDOM_NUMBERS
 import log
 from network import Network
-from modprime import add, mod, mul
+from modprime import add, array, matmul, mul, randoms, reconstruct, share, sub, summation
+from modprime import PACKED_DEGREE, pack_share, to_blocks, unpack, unpacking
+from beaver import open_triples
+from prss import Prss
+from gates import NAMES
+from wiring import WIRING, linear_gate, local_product
+
+# EXTRACT[k, j] = x_j ** k - turns the randoms dealt by all N parties into
+# N-T random double sharings
+EXTRACT = array([[pow(x, k, PRIME) for x in ALL_PARTIES]
+                 for k in range(N_PARTIES - DEGREE)])
 
 class BgwProtocol:
 
-    def __init__(self, party_no, private_value, network):
+    def __init__(self, party_no, private_value, network, expected=FUNCTION_RESULT, prss=None, store=None):
         log.write(f"Started BGW for party {party_no} with private value {private_value}")
 
         self.network = network
         self.secret = private_value
         self.party_no = party_no
 
+        # The opened circuit output, checked against expected unless None
+        self.result = self.correct = None
+        self.expected = expected
+
+        # Our share of the value on each gate's output wire, indexed by gate
+        # id, and the number of legs still to read it - a wire is freed when
+        # its last reader has it, so we only hold the circuit's live frontier
+        self.wires = [None] * len(WIRING.types)
+        self.readers = [len(fanout) for fanout in WIRING.fanout]
+
+        # Multiplication triples, generated offline - the run to use is
+        # agreed with the other parties before the first product
+        self.triples = None
+        if MUL_PROTOCOL == 'beaver':
+            self.store = open_triples(party_no, store)
+            if self.store:
+                self.store.announce(network)
+
+        # Double sharings for the whole circuit, generated up front - from
+        # PRSS seeds dealt here unless a daemon already holds them
+        self.prss = prss
+        if MUL_PROTOCOL == 'dn':
+            self.generate_doubles()
+
         # Go through and process all the gates
         self.process_gates()
 
     def process_gates(self):
-        for gate in GATES:
-            if GATES[gate][0] == INP and gate == self.party_no:
-                log.debug(f"Gate {gate}: START processing INP matching this party number", 1)
+        # Evaluate the circuit one multiplicative layer at a time. Every MUL
+        # gate in a layer is independent of the others, so their resharings
+        # are all sent before any are received - one round trip per layer
+        for depth, layer in enumerate(WIRING.layers):
+            log.debug(f"Layer {depth}: START processing gates {layer}", 1)
+
+            inp_gates = [gate for gate in layer if WIRING.types[gate] == INP]
+            if self.party_no in inp_gates:
+                log.debug(f"Gate {self.party_no}: START processing INP matching this party number", 1)
 
                 # Split our secret and share to all parties
-                self.split_and_send_shares(self.secret, gate)
-                log.debug(f"Gate {gate}: END processing INP", 1)
+                self.split_and_send_shares({self.party_no: self.secret})
+                self.network.flush()
+                log.debug(f"Gate {self.party_no}: END processing INP", 1)
 
-            if GATES[gate][0] == ADD:
-                log.debug(f"Gate {gate}: START processing ADD", 1)
+            for gate in inp_gates:
+                # We assume each party has an input gate with id = their party number
+                # So for each input gate, the source party and source gate are the same
+                self.set_output(self.network.receive_share(gate, gate), gate)
 
-                # Inputs either come from previous input gates or we sent to ourselves
-                inputs = self.get_inputs(gate)
+            mul_gates = [gate for gate in layer if WIRING.types[gate] in PRODUCTS]
+            if mul_gates:
+                outputs = self.multiply({gate: self.get_inputs(gate) for gate in mul_gates})
+                for gate in mul_gates:
+                    self.set_output(outputs[gate], gate)
+                    log.debug(f"Gate {gate}: END Processing MULT", 1)
+
+            # Local gates may consume MUL outputs of this layer, so run them last
+            for gate in layer:
+                if WIRING.types[gate] in LINEAR:
+                    log.debug(f"Gate {gate}: START processing {NAMES[WIRING.types[gate]]}", 1)
+
+                    # Inputs come from earlier gates' output wires
+                    inputs = self.get_inputs(gate)
+
+                    # Calculate the output, no communication needed
+                    output = linear_gate(WIRING.types[gate], inputs, WIRING.constants.get(gate))
+                    log.debug(f"Gate {gate}: Output of {NAMES[WIRING.types[gate]]} is {output}", 1)
+
+                    self.set_output(output, gate)
+                    log.debug(f"Gate {gate}: END processing {NAMES[WIRING.types[gate]]}", 1)
+
+        # Print blank line to separate parties in the logs
+        log.write('')
 
-                # Calculate the output
-                output = add(inputs[0], inputs[1])
-                log.debug(f"Gate {gate}: Output of ADD is {output}", 1)
+    def multiply(self, gate_inputs):
+        # Evaluate all the MUL and DOT gates of a layer in one round
+        if PACKING > 1:
+            return self.packed_multiply(gate_inputs)
+        if MUL_PROTOCOL == 'beaver':
+            return self.beaver_multiply(gate_inputs)
+        if MUL_PROTOCOL == 'dn':
+            return self.dn_multiply(gate_inputs)
+        return self.bgw_multiply(gate_inputs)
 
-                # Send the output to ourselves for further processing
-                self.send_output(output, gate)
-                log.debug(f"Gate {gate}: END processing ADD", 1)
-                
-            if GATES[gate][0] == MUL:
+    def bgw_multiply(self, gate_inputs):
+        # Any 2T+1 products determine the degree 2T polynomial, but every
+        # party must combine the resharings of the same 2T+1 parties or the
+        # reduced shares won't lie on one polynomial - so only those reshare
+        dealers = tuple(ALL_PARTIES[:2*DEGREE+1])
+        if self.party_no in dealers:
+            products = {}
+            for gate, inputs in gate_inputs.items():
                 log.debug(f"Gate {gate}: START processing MULT", 1)
-                inputs = self.get_inputs(gate)
 
-                # Calculate the output
-                output = mul(inputs[0], inputs[1])
-                log.debug(f"Gate {gate}: Internal result of multiplication is {output}", 1)
+                # Calculate the output - a DOT gate sums all its products
+                # locally, so it needs one reduction however many terms it has
+                products[gate] = local_product(inputs)
+                log.debug(f"Gate {gate}: Internal result of multiplication is {products[gate]}", 1)
 
-                # Split and sub-share this share of the multiplication
-                self.split_and_send_shares(output, gate)
+            # Split and sub-share our shares of all the layer's products,
+            # one message per party carries the whole layer's resharings
+            self.split_and_send_shares(products)
+        self.network.flush()
 
-                # Receive shares from everyone else
-                party_shares = {}
-                for party in ALL_PARTIES:
-                    # Set the clear flag to true to clear this from buffer
-                    party_shares[party] = self.network.receive_share(party, gate, True)
+        outputs = {}
+        for gate in gate_inputs:
+            # Receive shares from the dealers
+            party_shares = {}
+            for party in dealers:
+                party_shares[party] = self.network.receive_share(party, gate)
+
+            # Get the result of the multiplication - the local products
+            # lie on a polynomial of degree 2T
+            outputs[gate] = self.get_secret(party_shares, 2*DEGREE)
+            log.debug(f"Gate {gate}: Degree reduced output of MULT is {outputs[gate]}", 1)
+        return outputs
 
-                # Get the result of the multiplication
-                output = self.get_secret(party_shares, N_PARTIES)
-                log.debug(f"Gate {gate}: Degree reduced output of MULT is {output}", 1)
+    def packed_multiply(self, gate_inputs):
+        # Packed degree reduction - the first 2D+1 parties, D the packed
+        # degree, each deal a packed sharing of their product share weighted
+        # by its Lagrange coefficient for every secret point. Summing the
+        # dealt shares gives a degree D sharing of all the packed products
+        dealers = tuple(ALL_PARTIES[:2*PACKED_DEGREE+1])
+        if self.party_no in dealers:
+            weights = unpacking(dealers)[:, dealers.index(self.party_no)]
+            products = array([local_product(inputs) for inputs in gate_inputs.values()])
+            shares = pack_share(mul(products[..., None], weights))
+            for party in ALL_PARTIES:
+                for gate, party_share in zip(gate_inputs, shares[party-1]):
+                    self.network.send_share(party_share, gate, party)
+        self.network.flush()
 
-                self.send_output(output, gate)
-                log.debug(f"Gate {gate}: END Processing MULT", 1)
+        outputs = {}
+        for gate in gate_inputs:
+            outputs[gate] = summation([self.network.receive_share(party, gate)
+                                       for party in dealers])
+            log.debug(f"Gate {gate}: Packed output of MULT is {outputs[gate]}", 1)
+        return outputs
 
-        # Print blank line to separate parties in the logs
-        log.write('')
+    def beaver_multiply(self, gate_inputs):
+        # Mask each pair of legs with a precomputed triple (a, b, c) and
+        # open d = x-a and e = y-b - the opened values reveal nothing
+        if self.triples is None:
+            self.triples = self.store.agree({party: self.network.receive_share(party, 0)
+                                             for party in ALL_PARTIES})
+        for gate, inputs in gate_inputs.items():
+            log.debug(f"Gate {gate}: START processing MULT with Beaver triples", 1)
+            masked = self.beaver_mask(gate, inputs)
+            for party in ALL_PARTIES:
+                self.network.send_share(masked, gate, party)
+        self.network.flush()
+
+        outputs = {}
+        for gate in gate_inputs:
+            # Opening needs any T+1 shares, use the first to arrive
+            party_shares = self.network.receive_any(ALL_PARTIES, gate, DEGREE+1)
+            outputs[gate] = self.beaver_output(gate, party_shares)
+        return outputs
+
+    def beaver_mask(self, gate, inputs):
+        # Our shares of d and e for every pair of legs, in one vector
+        a, b, _c = self.triples[gate]
+        masked = []
+        for i in range(len(a)):
+            masked += [sub(inputs[2*i], a[i]), sub(inputs[2*i+1], b[i])]
+        return array(masked).ravel()
+
+    def beaver_output(self, gate, party_shares):
+        a, b, c = self.triples[gate]
+        opened = self.get_secret(party_shares).reshape(2*len(a), -1)
+        if not BATCH:
+            opened = opened[:, 0].tolist()
+
+        # x*y = c + d*b + e*a + d*e, summed over the pairs of a DOT gate
+        output = 0
+        for i in range(len(a)):
+            d, e = opened[2*i], opened[2*i+1]
+            output = add(output, add(add(c[i], mul(d, b[i])), add(mul(e, a[i]), mul(d, e))))
+        log.debug(f"Gate {gate}: Beaver output of MULT is {output}", 1)
+        return output
+
+    def generate_doubles(self):
+        # Damgard-Nielsen double sharings [r]_T and [r]_2T of the same random
+        # r, one for every MUL and DOT gate. Each party deals a batch of
+        # randoms and we extract N-T doubles from every N dealt with a
+        # Vandermonde matrix, so T colluding dealers learn nothing about them.
+        # With PRSS the round only deals seeds, and any number of doubles
+        # follow from them without communication
+        self.doubles = {}
+        senders = self.deal_doubles()
+        if senders is not None:
+            self.finish_doubles({party: self.network.receive_share(party, 0)
+                                 for party in senders})
+
+    def deal_doubles(self):
+        # Send our random double sharings or PRSS seeds, returns the parties
+        # to receive from - None if no doubles are needed
+        self.double_gates = [gate for gate in WIRING.gates if WIRING.types[gate] in PRODUCTS]
+        if not self.double_gates:
+            return None
+        if PRSS and self.prss is not None:
+            return []
+        if PRSS:
+            self.prss = Prss(self.party_no)
+            self.prss.deal(self.network)
+            return self.prss.leaders
+        needed = len(self.double_gates) * (BATCH or 1)
+        count = -(-needed // (N_PARTIES - DEGREE))
+        self.double_count = count
+        secrets = randoms(count)
+        shares = [share(secrets), share(secrets, 2*DEGREE)]
+        for party in ALL_PARTIES:
+            # Gate id 0 is never a real gate
+            self.network.send_share(array([s[party-1] for s in shares]).ravel(), 0, party)
+        self.network.flush()
+        return ALL_PARTIES
+
+    def finish_doubles(self, received):
+        # Our shares of the doubles, from what every party dealt us or from
+        # the PRSS seeds
+        needed = len(self.double_gates) * (BATCH or 1)
+        if PRSS:
+            for leader, seeds in received.items():
+                self.prss.accept(leader, seeds)
+            r_t = self.prss.random(needed)
+            r_2t = add(r_t, self.prss.zero(needed, 2*DEGREE))
+        else:
+            dealt = array([received[party] for party in ALL_PARTIES])
+            doubles = matmul(EXTRACT, dealt).reshape(N_PARTIES - DEGREE, 2, self.double_count)
+            r_t, r_2t = (doubles[:, i, :].ravel()[:needed] for i in range(2))
+        if BATCH:
+            r_t, r_2t = r_t.reshape(-1, BATCH), r_2t.reshape(-1, BATCH)
+        else:
+            r_t, r_2t = r_t.tolist(), r_2t.tolist()
+        self.doubles = {gate: (r_t[i], r_2t[i]) for i, gate in enumerate(self.double_gates)}
+        log.debug(f"Generated {needed} double sharings", 1)
+
+    def dn_multiply(self, gate_inputs):
+        # Mask our degree 2T product with [r]_2T and send it to the king,
+        # who opens the masked products and sends them back to everyone.
+        # [xy]_T = (xy + r) - [r]_T, O(N) messages per layer instead of N^2
+        for gate, inputs in gate_inputs.items():
+            log.debug(f"Gate {gate}: START processing MULT with double sharings", 1)
+            r_t, r_2t = self.doubles[gate]
+            self.network.send_share(add(local_product(inputs), r_2t), gate, KING)
+        self.network.flush()
+
+        if self.party_no == KING:
+            for gate in gate_inputs:
+                # The first 2T+1 masked products to arrive are enough
+                party_shares = self.network.receive_any(ALL_PARTIES, gate, 2*DEGREE+1)
+                opened = self.get_secret(party_shares, 2*DEGREE)
+                for party in ALL_PARTIES:
+                    self.network.send_share(opened, gate, party)
+            self.network.flush()
+
+        outputs = {}
+        for gate in gate_inputs:
+            opened = self.network.receive_share(KING, gate)
+            outputs[gate] = sub(opened, self.doubles[gate][0])
+            log.debug(f"Gate {gate}: DN output of MULT is {outputs[gate]}", 1)
+        return outputs
+
+    def set_output(self, output, gate):
+        # If this is not the last gate keep the share for further processing
+        if gate != WIRING.output:
+            log.debug(f"Gate {gate}: Output wire share is {output}", 2)
+            self.wires[gate] = output
 
-    def send_output(self, output, gate):
-        # If this is not the last gate send this share to ourselves
-        if  len(GATES[gate]) < 3 or GATES[gate][1] <= len(GATES):
-            log.debug(f"Gate {gate}: Sending {output} to ourselves", 2)
-            self.network.send_share(output, gate, self.party_no)
-        
         # If this is the last gate
         else:
+            # Open on the circuit output wire, so the opening can't be confused
+            # with any resharing for this gate still in the buffer
+            wire, _leg = WIRING.output_wire
             for party in ALL_PARTIES:
-                self.network.send_share(output, gate, party)
+                self.network.send_share(output, wire, party)
+            self.network.flush()
             
-            party_shares = {}
-            for party in ALL_PARTIES:
-                party_shares[party] = self.network.receive_share(party, gate)
+            # Reconstruct from the first shares to arrive, late ones are dropped
+            degree = PACKED_DEGREE if PACKING > 1 else DEGREE
+            party_shares = self.network.receive_any(ALL_PARTIES, wire, degree+1)
             log.debug(f"Gate {gate}: Party shares is {party_shares}", 2)
-            
+            self.report(party_shares, gate)
+
+    def report(self, party_shares, gate):
+        # Reconstruct the circuit output and check it against the expected result
+        if PACKING > 1:
+            # Blocks of PACKING records per share, drop the padding
+            secret = unpack(party_shares, PACKED_DEGREE).ravel()[:BATCH]
+        else:
             secret = self.get_secret(party_shares)
-            log.debug(f"Gate {gate}: Secret is {secret}", 2)
-            
-            if (secret == FUNCTION_RESULT):
-                log.write(f'SUCCESS! The secret of {secret} was calculated.')
-            
+        log.debug(f"Gate {gate}: Secret is {secret}", 2)
+        self.result = secret.tolist() if BATCH else int(secret)
+
+        if self.expected is None:
+            log.write('Result calculated')
+            return
+        self.correct = self.result == self.expected
+
+        if BATCH:
+            # Compare record by record, too many values to print
+            correct = sum(s == r for s, r in zip(self.result, self.expected))
+            if correct == BATCH:
+                log.write(f'SUCCESS! The secrets of all {BATCH} records were calculated.')
             else:
-                log.write(f'FAIL! We calculated {secret}, but the correct value was {FUNCTION_RESULT}')
-
-    def split_and_send_shares(self, value, src_gate):
-        coefs = [0 for x in range(DEGREE)]
-        for i in range(len(coefs)):
-            coefs[i] = int(random.random()*(PRIME-1))
-        '''
-        Custom coefficients to match Smart book example
-        a1 = [57.0, 93.0, 66.5, 14.5, 37.0, 93.5]
-        a2 = [68.0, 95.0, 17.5, 47.5, 91.0, 0.5]
-        if src_gate == 7:
-            a1 = [6.5, 98.0, 45.5, 83.5, 3.5, 33.5]
-            a2 = [52.5, 13.0, 30.5, 44.5, 15.5, 69.5]
-        coefs = [a1[self.party_no-1], a2[self.party_no-1]]
-        '''
-        # Get a list of share for logging
-        shares = []
+                log.write(f'FAIL! Only {correct} of {BATCH} records were calculated correctly')
+
+        elif (self.result == self.expected):
+            log.write(f'SUCCESS! The secret of {secret} was calculated.')
+
+        else:
+            log.write(f'FAIL! We calculated {secret}, but the correct value was {self.expected}')
+
+    def split_and_send_shares(self, values):
+        # Split a {gate: value} batch of secrets with a single matrix product
+        # and queue each party's share of every gate - in batch mode values
+        # and shares are vectors with one element per record, or with one
+        # element per block of PACKING records when packing
+        if PACKING > 1:
+            shares = pack_share(array([to_blocks(value) for value in values.values()]))
+        else:
+            shares = share(list(values.values()))
+        if not BATCH:
+            shares = shares.tolist()
         for party in ALL_PARTIES:
-            share = value
-            for i, c in enumerate(coefs):
-                share += c*(party**(i+1))
-            
-            share = int(mod(share))
-            self.network.send_share(share, src_gate, party)
-            shares.append(share)
-        log.debug(f"Gate {src_gate}: Split and sent value {value} into shares {shares} using coefficients {coefs}", 1)
-
-    @staticmethod
-    def get_lagrange(degree):
-        lagrange_basis = {}
-        for i in ALL_PARTIES:
-            product = 1
-            for j in range(1, degree + 1):
-                if i == j:
-                    continue
-                product *= j / (j-i)
-            lagrange_basis[i] = product
-        return lagrange_basis
-
-    def get_secret(self, party_shares, degree = DEGREE + 1):
-        lagrange_basis = self.get_lagrange(degree)
-        secret = 0
-        for i in lagrange_basis:
-            if i > degree:
-                break
-            secret += lagrange_basis[i] * party_shares[i]
-        secret = int(mod(secret))
+            for gate, party_share in zip(values, shares[party-1]):
+                self.network.send_share(party_share, gate, party)
+        log.debug(f"Gates {list(values)}: Split and sent values {list(values.values())} into shares {shares}", 1)
+
+    def get_secret(self, party_shares, degree = DEGREE):
+        secret = reconstruct(party_shares, degree)
         log.debug(f"Secret = {secret} recovered from shares from each party of {party_shares}", 1)
-        log.debug(f"using Lagrange basis functions of degree {degree} equal to {lagrange_basis}", 1)
+        log.debug(f"using Lagrange basis functions of degree {degree}", 1)
         return secret
 
     def get_inputs(self, gate):
-        inputs = []
-        # Loop through every gate and find gates that input into this gate
-        for gate_id, destinations in GATES.items():
-            if len(destinations) == 2:
-                gate_type, dest_list = destinations
-                for dest in dest_list:
-                    dest_gate, leg = dest
-                    self.process_inputs(inputs, gate, gate_id, gate_type, dest_gate, leg)
-            else:
-                (gate_type, dest_gate, leg) = destinations
-                self.process_inputs(inputs, gate, gate_id, gate_type, dest_gate, leg)
+        # Fan-in sources come from the compiled wiring, ordered by leg
+        inputs = [self.read_wire(src) for src in WIRING.sources[gate]]
         log.debug(f"Gate {gate}: Inputs are {inputs}", 2)
         return inputs
 
-    def process_inputs(self, inputs, gate, gate_id, gate_type, dest_gate, leg):
-        if dest_gate == gate:
-            if gate_type == INP:
-                # We assume each party has an input gate with id = their party number
-                # So for each input gate, the source party and source gate are the same
-                inputs.append(int(self.network.receive_share(gate_id, gate_id)))
-            else:
-                # Get shares we've sent to ourself within the network
-                inputs.append(int(self.network.receive_share(self.party_no, gate_id)))
-        return inputs
\ No newline at end of file
+    def read_wire(self, src):
+        # One leg reads the wire, free it if that was the last
+        wire = self.wires[src]
+        self.readers[src] -= 1
+        if self.readers[src] == 0:
+            self.wires[src] = None
+        return wire
@@ -0,0 +1,101 @@
+# uniform field elements from a seeded pseudo-random generator
+#
+# a 32 byte seed is expanded with SHAKE-256 in counter mode. the stream is
+# cut into candidates as wide as PRIME, masked to its bit length and any
+# candidate >= PRIME is rejected, so every element is exactly uniform (at
+# least half the candidates are kept). a producer thread keeps a few CHUNKs
+# of field elements ready, so big batches of share coefficients don't wait
+# on the generator. seeds are os.urandom unless replayed from a party number
+
+import hashlib   # sha256, shake_256
+import os        # urandom
+import queue     # Queue
+import threading # Lock, Thread
+
+import numpy as np
+
+from circuit import PRIME
+
+BITS  = PRIME.bit_length()
+BYTES = (BITS + 7) // 8      # bytes per candidate
+MASK  = (1 << BITS) - 1
+
+CHUNK = 1 << 16              # field elements per chunk
+DEPTH = 4                    # chunks generated ahead of use
+
+# ---------------------------------------------------------------------------
+
+def replay_seed(n):
+  # fixed seed for REPEATABLE_RANDOM_NUMBERS runs
+  return hashlib.sha256(b'mpc replay ' + str(n).encode()).digest()
+
+class Generator():
+  # the field element stream for one seed
+
+  def __init__(self, seed):
+    self.seed = seed
+    self.counter = 0
+    # fixed for the generator's lifetime, a producer thread may outlive a
+    # reload of this module (the tests do that to change PRIME)
+    self.prime, self.bytes, self.mask = PRIME, BYTES, MASK
+
+  def candidates(self, n):
+    # n candidates from the next block of the stream, those < PRIME kept -
+    # uint64 words when they fit, else python ints
+    width = self.bytes
+    data = hashlib.shake_256(self.seed + self.counter.to_bytes(8, 'big')).digest(n*width)
+    self.counter += 1
+    if width <= 8:
+      words = np.zeros((n, 8), dtype=np.uint8)
+      words[:, 8-width:] = np.frombuffer(data, np.uint8).reshape(n, width)
+      values = words.view('>u8').ravel().astype(np.uint64) & np.uint64(self.mask)
+      return values[values < self.prime]
+    values = (int.from_bytes(data[i:i+width], 'big') & self.mask for i in range(0, len(data), width))
+    return np.array([v for v in values if v < self.prime], dtype=object)
+
+  def chunk(self):
+    # exactly CHUNK field elements
+    parts, count = [], 0
+    while count < CHUNK:
+      parts.append(self.candidates(CHUNK))
+      count += len(parts[-1])
+    return np.concatenate(parts)[:CHUNK]
+
+def expand(seed, n):
+  # the first n field elements of the stream for seed
+  generator, parts, count = Generator(seed), [], 0
+  while count < n:
+    parts.append(generator.candidates(2*(n - count) + 8))
+    count += len(parts[-1])
+  return np.concatenate(parts)[:n]
+
+class Pool():
+  # field elements handed out in stream order however they're asked for, so
+  # a replayed seed gives the same values whatever the thread timing
+
+  def __init__(self, seed=None):
+    self.generator = Generator(seed or os.urandom(32))
+    self.chunks = queue.Queue(DEPTH)
+    self.buffer, self.pos = np.empty(0, dtype=np.uint64), 0
+    self.lock = threading.Lock()
+    self.producer = None
+
+  def produce(self):
+    while True:
+      self.chunks.put(self.generator.chunk())
+
+  def take(self, n):
+    # next n field elements as a 1-d array
+    with self.lock:
+      if self.producer is None:
+        self.producer = threading.Thread(target=self.produce, daemon=True)
+        self.producer.start()
+      parts = []
+      while n > 0:
+        if self.pos == len(self.buffer):
+          self.buffer, self.pos = self.chunks.get(), 0
+        part = self.buffer[self.pos:self.pos+n]
+        self.pos += len(part)
+        n -= len(part)
+        parts.append(part)
+      return parts[0] if len(parts) == 1 else np.concatenate(parts or [self.buffer[:0]])
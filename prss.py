@@ -0,0 +1,111 @@
+# pseudo-random secret sharing (config.PRSS = True), cramer-damgard-ishai
+#
+# setup gives every set A of N-T parties a PRG seed known only to its
+# members - the lowest numbered member picks it and sends it to the others.
+# afterwards party i's share of a fresh random [r]_T is
+#
+#   sum over A containing i of  PRG(seed_A) * f_A(i)
+#
+# where f_A is the degree T polynomial with f_A(0) = 1 and f_A(j) = 0 for the
+# T parties j outside A. any T parties miss the seed of the set that excludes
+# them, so r looks uniform to them. zero sharings of degree D > T add
+# x^k f_A(x) terms for k = 1..D-T, and [r]_2T = [r]_T + [0]_2T.
+# there are C(N, T) sets, so this is for small numbers of parties
+
+import hashlib   # sha256
+import itertools # combinations
+
+import numpy as np
+
+from circuit import ALL_PARTIES, DEGREE, N_PARTIES, PRIME
+from modprime import array, div, mul, randoms, summation
+from prg     import expand
+
+# field elements per seed, enough for 256 bits
+SEED_SIZE = -(-256 // (PRIME.bit_length() - 1))
+
+# ---------------------------------------------------------------------------
+
+def seed_key(elements):
+  return hashlib.sha256(','.join(str(int(e)) for e in elements).encode()).digest()
+
+def member_sets(party_no):
+  # the sets of N-T parties that party_no is in, in combinations order so
+  # every member lists them alike - C(N-1, T) of them, only built by Prss
+  # as the full list of C(N, T) sets won't fit in memory for large N
+  others = [p for p in ALL_PARTIES if p != party_no]
+  return sorted(tuple(sorted(rest + (party_no,)))
+                for rest in itertools.combinations(others, N_PARTIES - DEGREE - 1))
+
+def vanishing(subset, x):
+  # f_A(x) - 1 at 0, 0 at the parties outside the set
+  f = 1
+  for j in ALL_PARTIES:
+    if j not in subset:
+      f = mul(f, div(j - x, j))
+  return f
+
+class Prss():
+
+  def __init__(self, party_no):
+    self.party_no = party_no
+    self.subsets = member_sets(party_no)
+    self.weights = {A: vanishing(A, party_no) for A in self.subsets}
+    self.seeds = {}
+    # parties that send us the seeds of sets they lead
+    self.leaders = sorted({A[0] for A in self.subsets if A[0] != party_no})
+    self.session = 0
+    self.calls = 0
+
+  def deal(self, network):
+    # pick seeds for the sets we lead, sent with gate id 0 in one message
+    # per member
+    led = {A: randoms(SEED_SIZE) for A in self.subsets if A[0] == self.party_no}
+    for A, elements in led.items():
+      self.seeds[A] = seed_key(elements)
+    for party in ALL_PARTIES:
+      elements = [led[A] for A in led if party in A and party != self.party_no]
+      if elements:
+        network.send_share(np.concatenate(elements), 0, party)
+    network.flush()
+
+  def accept(self, leader, share):
+    # the seeds of the sets leader leads that we're in, in set order
+    sets = [A for A in self.subsets if A[0] == leader]
+    for A, elements in zip(sets, np.reshape(share, (len(sets), SEED_SIZE))):
+      self.seeds[A] = seed_key(elements)
+
+  def start_session(self, session):
+    # fresh streams for a daemon's job, the same for every party however
+    # many calls earlier jobs made before they ended
+    self.session, self.calls = session, 0
+
+  def stream(self, A, n, k=0):
+    # n field elements, different on every call but the same for every
+    # member of A as all parties make the same calls
+    label = self.session.to_bytes(8, 'big') + self.calls.to_bytes(8, 'big') + k.to_bytes(2, 'big')
+    values = expand(self.seeds[A] + label, n)
+    return array(values.tolist()) if values.dtype == object else array(values)
+
+  def random(self, shape):
+    # our share of degree T of an array of fresh random secrets
+    n = int(np.prod(shape))
+    self.calls += 1
+    share = summation([mul(self.stream(A, n), self.weights[A]) for A in self.subsets])
+    return share.reshape(shape)
+
+  def zero(self, shape, degree=2*DEGREE):
+    # our share of degree `degree` of an array of zeros
+    n = int(np.prod(shape))
+    self.calls += 1
+    terms = [mul(self.stream(A, n, k), mul(pow(self.party_no, k, PRIME), self.weights[A]))
+             for A in self.subsets for k in range(1, degree - DEGREE + 1)]
+    return summation(terms).reshape(shape) if terms else array(np.zeros(shape, dtype=int))
+
+def setup_prss(party_no, network):
+  # one round - deal our seeds and collect the rest
+  prss = Prss(party_no)
+  prss.deal(network)
+  for leader in prss.leaders:
+    prss.accept(leader, network.receive_share(leader, 0))
+  return prss
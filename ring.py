@@ -0,0 +1,118 @@
+# shared memory ring buffers (config.TRANSPORT = 'shm')
+#
+# one single-producer single-consumer byte ring per ordered pair of parties on
+# the same host, named after LOCAL_PORT and the pair so parties find each
+# other without sockets. the receiver creates its incoming rings and senders
+# attach to them. head and tail count the bytes ever written and read, each
+# is only changed by one side so no locks are needed. a write bigger than
+# the free space goes in pieces as the reader makes room
+#
+# head and tail are published with plain stores and there are no fences,
+# which is only safe where other cores see stores in program order - x86.
+# on arm a reader could see a new head before the bytes it covers, so the
+# transport is refused there
+
+import platform # machine
+import time     # sleep
+
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from config import LOCAL_PORT, RING_SIZE
+
+HEADER = 192                 # head, tail and state on their own cache lines
+HEAD, TAIL, STATE = 0, 8, 16 # header words
+READY, CLOSED = 1, 2         # states
+SPIN = 50e-6                 # seconds between polls of an empty or full ring
+
+# total store order, see above
+X86 = platform.machine().lower() in ('x86_64', 'amd64', 'i386', 'i686', 'x86')
+
+# ---------------------------------------------------------------------------
+
+def ring_name(sender, receiver):
+  return f'mpc_{LOCAL_PORT}_{sender}_{receiver}'
+
+class Ring():
+
+  def __init__(self, memory, owner):
+    self.memory = memory
+    self.owner = owner       # the receiver, which unlinks the ring
+    self.header = np.ndarray((HEADER // 8,), np.uint64, memory.buf)
+    self.data = memory.buf[HEADER:HEADER+RING_SIZE]
+
+  @classmethod
+  def create(cls, sender, receiver):
+    name = ring_name(sender, receiver)
+    try:
+      memory = shared_memory.SharedMemory(name, create=True, size=HEADER+RING_SIZE)
+    except FileExistsError:
+      # left behind by a killed run - close it on any sender still attached
+      # to it, then start afresh
+      stale = cls(shared_memory.SharedMemory(name), True)
+      stale.close()
+      memory = shared_memory.SharedMemory(name, create=True, size=HEADER+RING_SIZE)
+    ring = cls(memory, True)
+    ring.header[STATE] = READY
+    return ring
+
+  @classmethod
+  def attach(cls, sender, receiver):
+    # wait until the receiver has created the ring, parties start in any order
+    while True:
+      try:
+        memory = shared_memory.SharedMemory(ring_name(sender, receiver))
+      except (FileNotFoundError, ValueError):   # not there or not sized yet
+        time.sleep(SPIN)
+        continue
+      # only the receiver's tracker may unlink the ring
+      resource_tracker.unregister(memory._name, 'shared_memory')
+      ring = cls(memory, False)
+      if ring.header[STATE] == READY:
+        return ring
+      ring.close()
+      time.sleep(SPIN)
+
+  def closed(self):
+    return self.header[STATE] == CLOSED
+
+  def write(self, data):
+    # copy data in, waiting for the reader whenever the ring is full - data
+    # for a receiver that has gone is dropped
+    view, pos = memoryview(data), 0
+    head = int(self.header[HEAD])
+    while pos < len(view):
+      free = RING_SIZE - (head - int(self.header[TAIL]))
+      if free == 0:
+        if self.closed():
+          return
+        time.sleep(SPIN)
+        continue
+      start = head % RING_SIZE
+      n = min(free, len(view) - pos, RING_SIZE - start)
+      self.data[start:start+n] = view[pos:pos+n]
+      pos, head = pos + n, head + n
+      self.header[HEAD] = head
+
+  def read(self):
+    # all the bytes written since the last read, possibly ending part way
+    # through a message
+    tail, head = int(self.header[TAIL]), int(self.header[HEAD])
+    if head == tail:
+      return b''
+    start, n = tail % RING_SIZE, head - tail
+    first = min(n, RING_SIZE - start)
+    data = bytes(self.data[start:start+first]) + bytes(self.data[:n-first])
+    self.header[TAIL] = head
+    return data
+
+  def close(self):
+    # numpy and memoryview references must go before the mapping can
+    if self.owner:
+      self.header[STATE] = CLOSED
+    del self.header
+    self.data.release()
+    self.memory.close()
+    if self.owner:
+      self.memory.unlink()
@@ -0,0 +1,104 @@
+# Beaver triples - the store every party writes offline and takes runs
+# from, and products opened against the triples taken from it
+#
+#   python3 -m pytest test_beaver.py
+
+import json # load
+
+import numpy as np
+import pytest
+
+import beaver
+
+from circuit  import ALL_PARTIES, DEGREE, PRODUCTS
+from conftest import Mailbox, open_shares
+from party    import BgwProtocol
+from wiring   import WIRING
+
+RUNS = 4
+
+@pytest.fixture(params=[101, 2**61 - 1, 2**127 - 1])
+def field(request, reload, monkeypatch, tmp_path):
+  # every party's store of RUNS runs of shared triples, in a fresh directory
+  field = reload(request.param)
+  monkeypatch.setattr(beaver, 'TRIPLES_FILE', str(tmp_path / 'party_{:02}.npy'))
+  monkeypatch.setattr(beaver, 'OFFLINE_RUNS', RUNS)
+  count = RUNS * beaver.triples_needed()
+  a, b = field.randoms((2, count))
+  shares = [field.share(t) for t in (a, b, field.mul(a, b))]
+  for p in ALL_PARTIES:
+    beaver.save_triples(p, *(t[p-1] for t in shares))
+  return field
+
+def as_ints(values):
+  return [int(v) for v in np.ravel(values)]
+
+def agree(stores):
+  # every party announces its next run and takes the agreed one
+  mail = {p: Mailbox() for p in stores}
+  for p, store in stores.items():
+    store.announce(mail[p])
+  return {p: store.agree({q: mail[q].sent[(p, 0)] for q in stores})
+          for p, store in stores.items()}
+
+def test_store_needs_no_pickle(field):
+  store = np.load(beaver.TRIPLES_FILE.format(1), allow_pickle=False)
+  assert store.shape[:2] == (3, RUNS * beaver.triples_needed())
+
+def test_runs_in_order(field):
+  # runs are consecutive slices of the store, each taken once
+  store = beaver.Triples(1)
+  whole = beaver.from_words(np.load(beaver.TRIPLES_FILE.format(1)))
+  needed = beaver.triples_needed()
+  for run in range(RUNS):
+    triples = store.take(run)
+    taken = [v for gate in sorted(triples) for v in as_ints(triples[gate][0])]
+    assert taken == as_ints(whole[0, run*needed:(run+1)*needed])
+  with pytest.raises(AssertionError):
+    store.take(RUNS)
+  with pytest.raises(AssertionError):
+    store.take(1)
+
+def test_counter_survives_restart(field):
+  beaver.Triples(2).take(0)
+  assert beaver.Triples(2).next == 1
+  # a daemon reserves ahead, and runs it didn't use are never handed out
+  daemon = beaver.Triples(2, reserve=2)
+  daemon.take(1)
+  with open(beaver.state_file(2)) as f:
+    assert json.load(f)['next'] == 3
+  assert beaver.Triples(2).next == 3
+
+def test_run_numbers(field):
+  # run numbers may need more than one field element
+  for run in [0, 1, 63, 64, 100, 101, 2**20, 2**32 - 1]:
+    assert beaver.decode_run(beaver.encode_run(run)) == run
+
+def test_parties_agree_on_run(field):
+  # a party that used runs the others didn't pulls them all forward
+  beaver.Triples(4).take(1)
+  stores = {p: beaver.Triples(p) for p in ALL_PARTIES}
+  agree(stores)
+  assert {store.next for store in stores.values()} == {3}
+
+def test_products(field):
+  # every product gate of the circuit, with the triples the parties agree
+  # on, opens to the sum of the products of its pairs of legs
+  beaver.Triples(3).take(0)
+  stores = {p: beaver.Triples(p) for p in ALL_PARTIES}
+  protocols = {}
+  for p, triples in agree(stores).items():
+    protocols[p] = BgwProtocol.__new__(BgwProtocol)
+    protocols[p].party_no, protocols[p].triples = p, triples
+
+  p = field.PRIME
+  for gate in [g for g in WIRING.gates if WIRING.types[g] in PRODUCTS]:
+    legs = field.randoms(len(WIRING.sources[gate]))
+    shares = field.share(legs)
+    masked = {q: protocol.beaver_mask(gate, as_ints(shares[q-1]))
+              for q, protocol in protocols.items()}
+    # any T+1 masked shares open d and e
+    opening = {q: masked[q] for q in ALL_PARTIES[-DEGREE-1:]}
+    output = {q: protocol.beaver_output(gate, opening) for q, protocol in protocols.items()}
+    x = as_ints(legs)
+    assert open_shares(output, DEGREE) == sum(x[i] * x[i+1] for i in range(0, len(x), 2)) % p
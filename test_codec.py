@@ -0,0 +1,55 @@
+# share messages survive encode and decode unchanged
+#
+#   python3 -m pytest test_codec.py
+
+import numpy as np
+import pytest
+
+import codec
+
+# primes either side of the 8 byte word, the widest values are PRIME-1
+PRIMES = [101, 2**61 - 1, 2**64 - 59, 2**127 - 1, 2**521 - 1]
+
+@pytest.fixture(params=PRIMES)
+def field(request, reload):
+  return reload(request.param)
+
+def as_ints(share):
+  return [int(v) for v in share] if np.ndim(share) else int(share)
+
+def roundtrip(items, sender=3, session=0):
+  msg_sender, msg_session, msg_items = codec.decode(codec.encode(sender, items, session))
+  assert (msg_sender, msg_session) == (sender, session)
+  assert [gate for gate, _ in msg_items] == [gate for gate, _ in items]
+  return [share for _, share in msg_items]
+
+def test_scalars(field):
+  p = field.PRIME
+  shares = roundtrip([(1, 0), (2, 1), (3, p-1), (4, field.array([p-1])[0])])
+  assert [as_ints(s) for s in shares] == [0, 1, p-1, p-1]
+  assert all(np.ndim(s) == 0 for s in shares)
+
+def test_vectors(field):
+  p = field.PRIME
+  vector = field.array([0, 1, p-2, p-1] * 5)
+  [share] = roundtrip([(7, vector)])
+  assert as_ints(share) == as_ints(vector)
+  assert share.dtype == field.DTYPE
+
+def test_empty_batch(field):
+  [share, scalar] = roundtrip([(5, field.array([])), (6, 9)])
+  assert np.ndim(share) == 1 and len(share) == 0
+  assert as_ints(scalar) == 9
+
+def test_no_items(field):
+  assert roundtrip([]) == []
+
+def test_varint_edges(field):
+  # one and several byte varints for sender, session, gate and size
+  for n in (0, 127, 128, 16383, 16384, 2**63):
+    buf = bytearray()
+    codec.put_varint(buf, n)
+    assert codec.get_varint(bytes(buf), 0) == (n, len(buf))
+  values = [v % field.PRIME for v in range(200)]
+  [share] = roundtrip([(2**40, field.array(values))], sender=300, session=2**50)
+  assert as_ints(share) == values
@@ -0,0 +1,111 @@
+# compiled circuits evaluated in the clear against the expression itself,
+# and the shape the compiler's passes should leave them in
+#
+#   python3 -m pytest test_compiler.py
+
+import ast    # parse
+import random # Random
+
+import pytest
+
+import wiring
+
+from compiler import compile_expression
+from gates    import ADD, DOT, INP, MUL, PRODUCTS
+
+PRIME = 2**61 - 1
+
+SOURCES = [
+  "x1*x2",
+  "x1*x2 + x3*x4 + x5*x6",
+  "x1*x2*x3*x4*x5*x6*x7*x8",
+  "x1 - x2",
+  "-x1*x2 + 3",
+  "-(x1 - x2)*(x2 - x1)",
+  "2*x1*x2 - 5*x3 + 7",
+  "x1*x2 + x2*x1 + x1*x2*x3",
+  "t = x1*x2\nt*x3 - 2*t*x4 + 1",
+  "a = x1 + x2\nb = a*a\nb*b - a*x3",
+  "u = x1*x9\nx3*x4",
+  "(x1 - 1)*(x2 - 2)*(x3 - 3) - x4*x5*6",
+  "x1*(x2 + x3*(x4 + x5*(x6 + x7)))",
+  "0*x1*x2 + x3*x4",
+  "x1*x2 - x1*x2 + x3*x3",
+]
+
+@pytest.fixture
+def field(reload):
+  # a big prime, so constants and signs that go wrong don't wrap to right
+  return reload(PRIME)
+
+def evaluate(gates, x):
+  # the circuit in the clear, with the wiring parties use
+  circuit = wiring.Wiring(gates)
+  values = {}
+  for gate in circuit.gates:
+    kind = circuit.types[gate]
+    inputs = [values[src] for src in circuit.sources[gate]]
+    if kind == INP:
+      values[gate] = x[gate] % PRIME
+    elif kind in PRODUCTS:
+      values[gate] = int(wiring.local_product(inputs))
+    else:
+      values[gate] = int(wiring.linear_gate(kind, inputs, circuit.constants.get(gate)))
+  return values[circuit.output]
+
+def direct(source, x):
+  # the expression evaluated as python
+  statements = ast.parse(source).body
+  names = {f'x{p}': v for p, v in x.items()}
+  exec(compile(ast.Module(statements[:-1], []), 'source', 'exec'), {}, names)
+  return eval(compile(ast.Expression(statements[-1].value), 'source', 'eval'), {}, names) % PRIME
+
+def kinds(gates):
+  return [entry[0] for entry in gates.values()]
+
+@pytest.mark.parametrize('source', SOURCES)
+def test_matches_direct_evaluation(field, source):
+  gates = compile_expression(source)
+  rng = random.Random(source)
+  for _ in range(5):
+    x = {p: rng.randrange(PRIME) for p in range(1, 10)}
+    assert evaluate(gates, x) == direct(source, x)
+  edge = {p: PRIME - 1 for p in range(1, 10)}
+  assert evaluate(gates, edge) == direct(source, edge)
+
+def test_parties_add_unused_inputs(field):
+  gates = compile_expression("x1*x2", parties=4)
+  assert [g for g, entry in gates.items() if entry[0] == INP] == [1, 2, 3, 4]
+  assert evaluate(gates, {1: 3, 2: 5, 3: 7, 4: 11}) == 15
+
+def test_balancing_minimises_depth(field):
+  gates = compile_expression("x1*x2*x3*x4*x5*x6*x7*x8")
+  circuit = wiring.Wiring(gates)
+  assert kinds(gates).count(MUL) == 7
+  assert circuit.depths[circuit.output] == 3
+
+def test_cse_shares_repeated_subexpressions(field):
+  # x1*x2 is built once, however it's written
+  gates = compile_expression("x1*x2*x3 + x2*x1*x4")
+  products = [entry for entry in gates.values() if entry[0] in PRODUCTS]
+  assert len(products) == 2
+
+def test_dead_gates_removed(field):
+  # u's products go, party 5 still has its input gate
+  gates = compile_expression("u = x1*x2*x5\nx3*x4")
+  assert kinds(gates) == [INP] * 5 + [MUL]
+
+def test_dot_fusion(field):
+  gates = compile_expression("x1*x2 + x3*x4 + x5*x6")
+  circuit = wiring.Wiring(gates)
+  assert kinds(gates) == [INP] * 6 + [DOT]
+  assert ADD not in kinds(gates)
+  assert circuit.depths[circuit.output] == 1
+
+def test_rejects_unsupported(field):
+  with pytest.raises(ValueError):
+    compile_expression("x1 / x2")
+  with pytest.raises(ValueError):
+    compile_expression("y*x1")
+  with pytest.raises(AssertionError):
+    compile_expression("x1")
@@ -0,0 +1,136 @@
+# field arithmetic on every backend checked against plain python ints
+#
+#   python3 -m pytest test_modprime.py
+
+import random    # Random
+
+import numpy as np
+import pytest
+
+import circuit
+import config
+import modprime
+
+# a prime for each backend - int64 only takes small ones
+PRIMES = {
+  'int64':  101,
+  'uint64': 2**61 - 1,
+  'gmpy2':  2**127 - 1,
+  'python': 2**127 - 1,
+}
+
+def check_backend(backend):
+  if backend == 'uint64' and np.finfo(np.longdouble).nmant < 63:
+    pytest.skip('long double has no 64 bit mantissa')
+  if backend == 'gmpy2' and modprime.gmpy2 is None:
+    pytest.skip('gmpy2 is not installed')
+
+@pytest.fixture(params=list(PRIMES))
+def field(request, reload):
+  check_backend(request.param)
+  return reload(PRIMES[request.param], request.param)
+
+@pytest.fixture(params=list(PRIMES))
+def packed(request, reload, monkeypatch):
+  # as many records per polynomial as T = 1 allows, 2(T+K-1) < N - the
+  # monkeypatch is undone before reload puts the field back
+  check_backend(request.param)
+  monkeypatch.setattr(circuit, 'DEGREE', 1)
+  monkeypatch.setattr(circuit, 'BATCH', 10)
+  monkeypatch.setattr(config, 'PACKING', (circuit.N_PARTIES - 1) // 2)
+  return reload(PRIMES[request.param], request.param)
+
+def values(p, n=50, seed=0):
+  # edge values then random ones, as python ints
+  rng = random.Random(seed)
+  return [0, 1, 2, p-2, p-1] + [rng.randrange(p) for _ in range(n)]
+
+def as_ints(a):
+  return [int(v) for v in np.ravel(a)]
+
+def test_backend(field):
+  assert field.BACKEND == config.FIELD
+  assert field.array([1, 2]).dtype == field.DTYPE
+
+def test_add_sub_mul(field):
+  p = field.PRIME
+  xs, ys = values(p, seed=1), values(p, seed=2)[::-1]
+  a, b = field.array(xs), field.array(ys)
+  assert as_ints(field.add(a, b)) == [(x + y) % p for x, y in zip(xs, ys)]
+  assert as_ints(field.sub(a, b)) == [(x - y) % p for x, y in zip(xs, ys)]
+  assert as_ints(field.mul(a, b)) == [x * y % p for x, y in zip(xs, ys)]
+  # array with scalar
+  assert as_ints(field.mul(a, p-1)) == [x * (p-1) % p for x in xs]
+
+def test_inv(field):
+  p = field.PRIME
+  xs = [x for x in values(p) if x]
+  assert as_ints(field.inv(field.array(xs))) == [pow(x, p-2, p) for x in xs]
+  assert int(field.inv(p-1)) == p-1
+  assert int(field.inv(field.array([3])[0])) == pow(3, p-2, p)
+
+def test_batch_inv(field):
+  p = field.PRIME
+  xs = [x for x in values(p) if x][:50]
+  assert field.batch_inv(xs) == [pow(x, p-2, p) for x in xs]
+  inverses = field.batch_inv(field.array(xs).reshape(5, 10))
+  assert inverses.shape == (5, 10)
+  assert inverses.dtype == field.DTYPE
+  assert as_ints(inverses) == [pow(x, p-2, p) for x in xs]
+  assert field.batch_inv([]) == []
+
+def test_summation_product(field):
+  p = field.PRIME
+  rows = [values(p, n=10, seed=k) for k in range(6)]
+  arrays = [field.array(row) for row in rows]
+  assert as_ints(field.summation(arrays)) == [sum(col) % p for col in zip(*rows)]
+  expected = []
+  for col in zip(*rows):
+    x = 1
+    for v in col:
+      x = x * v % p
+    expected.append(x)
+  assert as_ints(field.product(arrays)) == expected
+
+def test_dot_matmul(field):
+  p = field.PRIME
+  xs, ys = values(p, n=10, seed=3), values(p, n=10, seed=4)
+  assert int(field.dot(xs, ys)) == sum(x * y for x, y in zip(xs, ys)) % p
+  a = field.array(xs[:12]).reshape(3, 4)
+  b = field.array(ys[:8]).reshape(4, 2)
+  expected = [sum(xs[4*i + k] * ys[2*k + j] for k in range(4)) % p
+              for i in range(3) for j in range(2)]
+  assert as_ints(field.matmul(a, b)) == expected
+
+def test_share_reconstruct(field):
+  secrets = field.array(values(field.PRIME, n=5))
+  shares = field.share(secrets)
+  points = {x: shares[x-1] for x in circuit.ALL_PARTIES}
+  assert as_ints(field.reconstruct(points, circuit.DEGREE)) == as_ints(secrets)
+
+def test_pack_unpack(packed):
+  k, degree = packed.PACKING, packed.PACKED_DEGREE
+  blocks = packed.array(values(packed.PRIME, n=5*k - 5)).reshape(5, k)
+  shares = packed.pack_share(blocks)
+  assert shares.shape == (circuit.N_PARTIES, 5)
+  # any degree+1 parties unpack the same blocks
+  for first in range(circuit.N_PARTIES - degree):
+    points = {x: shares[x-1] for x in circuit.ALL_PARTIES[first:first+degree+1]}
+    assert as_ints(packed.unpack(points, degree)) == as_ints(blocks)
+
+def test_packed_products(packed):
+  # share by share products lie on a polynomial of twice the degree and
+  # unpack to the products of the records
+  p, k = packed.PRIME, packed.PACKING
+  xs, ys = values(p, n=3*k - 5, seed=1), values(p, n=3*k - 5, seed=2)
+  x = packed.pack_share(packed.array(xs).reshape(3, k))
+  y = packed.pack_share(packed.array(ys).reshape(3, k))
+  points = {p: packed.mul(x[p-1], y[p-1]) for p in circuit.ALL_PARTIES}
+  products = packed.unpack(points, 2*packed.PACKED_DEGREE)
+  assert as_ints(products) == [a * b % p for a, b in zip(xs, ys)]
+
+def test_to_blocks(packed):
+  k = packed.PACKING
+  blocks = packed.to_blocks(list(range(1, 2*k + 2)))
+  assert blocks.shape == (3, k)
+  assert as_ints(blocks.ravel()) == list(range(1, 2*k + 2)) + [0] * (k - 1)
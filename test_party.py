@@ -0,0 +1,73 @@
+# protocol steps of BgwProtocol run for every party in one process, through
+# mailboxes instead of the network, and the shares they leave reconstructed
+#
+#   python3 -m pytest test_party.py
+
+import pytest
+
+import party
+
+from circuit import ALL_PARTIES, DEGREE, PRODUCTS
+from conftest import Mailbox, deal_prss, open_shares
+from party    import BgwProtocol
+from wiring   import WIRING
+
+T = DEGREE
+
+def protocols(prss=None):
+  # a BgwProtocol for every party, without evaluating the circuit
+  parties = {}
+  for p in ALL_PARTIES:
+    protocol = BgwProtocol.__new__(BgwProtocol)
+    protocol.party_no, protocol.network = p, Mailbox()
+    protocol.prss = prss[p] if prss else None
+    parties[p] = protocol
+  return parties
+
+def make_doubles(parties):
+  # every party deals, then finishes with what was dealt to it
+  senders = {p: protocol.deal_doubles() for p, protocol in parties.items()}
+  for p, protocol in parties.items():
+    protocol.finish_doubles({q: parties[q].network.sent[(p, 0)] for q in senders[p]})
+
+def check_doubles(parties):
+  # one double per MUL and DOT gate, [r]_T and [r]_2T of the same r
+  gates = [gate for gate in WIRING.gates if WIRING.types[gate] in PRODUCTS]
+  assert gates
+  opened, lower = [], []
+  for gate in gates:
+    r_t = {p: protocol.doubles[gate][0] for p, protocol in parties.items()}
+    r_2t = {p: protocol.doubles[gate][1] for p, protocol in parties.items()}
+    r = open_shares(r_t, T)
+    assert r is not None and open_shares(r_2t, 2*T) == r
+    opened.append(r)
+    lower += [open_shares(r_t, T-1), open_shares(r_2t, 2*T-1)]
+  # of no lower degree - a single small field element may lie on a lower
+  # degree polynomial by chance, all of them won't
+  assert any(secret is None for secret in lower[0::2])
+  assert any(secret is None for secret in lower[1::2])
+  return opened
+
+@pytest.mark.parametrize('batch', [None, 4])
+def test_dn_doubles(monkeypatch, batch):
+  monkeypatch.setattr(party, 'BATCH', batch)
+  parties = protocols()
+  make_doubles(parties)
+  opened = check_doubles(parties)
+  if batch:
+    assert all(len(r) == batch for r in opened)
+
+def test_dn_doubles_prss_dealt(monkeypatch):
+  # PRSS seeds dealt by the protocol itself, as for a single run
+  monkeypatch.setattr(party, 'PRSS', True)
+  parties = protocols()
+  make_doubles(parties)
+  check_doubles(parties)
+
+def test_dn_doubles_prss_kept(monkeypatch):
+  # seeds a daemon dealt once, no messages at all
+  monkeypatch.setattr(party, 'PRSS', True)
+  parties = protocols(deal_prss())
+  make_doubles(parties)
+  assert all(not protocol.network.sent for protocol in parties.values())
+  check_doubles(parties)
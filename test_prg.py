@@ -0,0 +1,67 @@
+# the SHAKE-256 field element stream against known expansions
+#
+#   python3 -m pytest test_prg.py
+
+import hashlib # shake_256
+
+import pytest
+
+import prg
+
+# expand(seed, n) of prg.py as first released, for a small, a word sized
+# and a big prime
+KNOWN = [
+  (101, bytes(32), [73, 43, 72, 58, 88, 74, 53, 16]),
+  (2**61 - 1, bytes(32), [696729982785467792, 394703820462224605,
+                          365677324286019551, 2006511820163828787]),
+  (2**127 - 1, b'\x01' * 32, [100180296379256233818993065615569878335,
+                              52195451323465143341729854153375612061,
+                              88170625447215581227822384054592004134]),
+]
+
+def reference(seed, n, prime):
+  # the stream as described in prg.py - candidates as wide as the prime,
+  # masked to its bit length, those >= prime rejected
+  bits = prime.bit_length()
+  width = (bits + 7) // 8
+  values, counter = [], 0
+  while len(values) < n:
+    block = 2*(n - len(values)) + 8
+    data = hashlib.shake_256(seed + counter.to_bytes(8, 'big')).digest(block*width)
+    counter += 1
+    for i in range(0, len(data), width):
+      v = int.from_bytes(data[i:i+width], 'big') & ((1 << bits) - 1)
+      if v < prime:
+        values.append(v)
+  return values[:n]
+
+@pytest.mark.parametrize('prime, seed, expected', KNOWN)
+def test_known_expansions(reload, prime, seed, expected):
+  reload(prime)
+  assert prg.expand(seed, len(expected)).tolist() == expected
+
+@pytest.mark.parametrize('prime', [101, 2**61 - 1, 2**127 - 1])
+def test_matches_reference(reload, prime):
+  reload(prime)
+  seed = prg.replay_seed(7)
+  values = prg.expand(seed, 1000).tolist()
+  assert values == reference(seed, 1000, prime)
+  assert all(0 <= v < prime for v in values)
+
+def test_pool_replays_in_stream_order():
+  # however the values are asked for, the same seed gives the same stream
+  seed = prg.replay_seed(3)
+  whole = prg.Pool(seed).take(1000)
+  pool = prg.Pool(seed)
+  pieces = [pool.take(n) for n in (1, 10, 0, 989)]
+  assert [int(v) for piece in pieces for v in piece] == whole.tolist()
+  assert whole.tolist() == prg.expand(seed, 1000).tolist()
+
+def test_pool_crosses_chunks():
+  pool = prg.Pool(prg.replay_seed(4))
+  values = pool.take(prg.CHUNK + 10)
+  assert len(values) == prg.CHUNK + 10
+  assert len(pool.take(prg.CHUNK)) == prg.CHUNK
+
+def test_seeds_differ():
+  assert prg.expand(prg.replay_seed(1), 16).tolist() != prg.expand(prg.replay_seed(2), 16).tolist()
@@ -0,0 +1,68 @@
+# pseudo-random secret sharing - every party's shares, derived locally from
+# the dealt seeds, reconstructed together
+#
+#   python3 -m pytest test_prss.py
+
+import itertools # combinations
+import math      # comb
+
+import pytest
+
+import circuit
+import modprime
+import prss
+
+from conftest import deal_prss, open_shares
+
+T = circuit.DEGREE
+
+@pytest.fixture(params=[101, 2**61 - 1, 2**127 - 1])
+def parties(request, reload):
+  reload(request.param)
+  return deal_prss()
+
+def test_member_sets():
+  everyone = list(itertools.combinations(circuit.ALL_PARTIES, circuit.N_PARTIES - T))
+  for p in circuit.ALL_PARTIES:
+    sets = prss.member_sets(p)
+    assert sets == [A for A in everyone if p in A]
+    assert len(sets) == math.comb(circuit.N_PARTIES - 1, T)
+
+def test_seeds_agree(parties):
+  # every member of a set holds its seed, no one else does
+  for A in itertools.combinations(circuit.ALL_PARTIES, circuit.N_PARTIES - T):
+    seeds = {parties[p].seeds[A] for p in A}
+    assert len(seeds) == 1
+    assert all(A not in parties[p].seeds for p in circuit.ALL_PARTIES if p not in A)
+
+def test_random_degree_t(parties):
+  shares = {p: party.random(20) for p, party in parties.items()}
+  assert open_shares(shares, T) is not None
+  # and no lower, which T-1 colluding parties could open
+  assert open_shares(shares, T-1) is None
+
+def test_random_is_fresh(parties):
+  first = open_shares({p: party.random(20) for p, party in parties.items()}, T)
+  second = open_shares({p: party.random(20) for p, party in parties.items()}, T)
+  assert first != second
+
+def test_zero_degree_2t(parties):
+  shares = {p: party.zero(20) for p, party in parties.items()}
+  assert open_shares(shares, 2*T) == [0] * 20
+  assert open_shares(shares, 2*T - 1) is None
+
+def test_double_sharing(parties):
+  # [r]_2T = [r]_T + [0]_2T opens to the same r
+  r_t = {p: party.random(20) for p, party in parties.items()}
+  zero = {p: party.zero(20) for p, party in parties.items()}
+  r_2t = {p: modprime.add(r_t[p], zero[p]) for p in parties}
+  assert open_shares(r_2t, 2*T) == open_shares(r_t, T)
+
+def test_sessions_replay(parties):
+  # a daemon job's streams depend on its session only
+  def draw(session):
+    for party in parties.values():
+      party.start_session(session)
+    return open_shares({p: party.random(5) for p, party in parties.items()}, T)
+  assert draw(7) == draw(7)
+  assert draw(7) != draw(8)
@@ -0,0 +1,77 @@
+# compiled form of the GATES table in circuit.py - built once at load time so
+# that parties can evaluate the circuit in time linear in the number of gates
+
+import array # array
+
+from circuit import GATES, PRIME, PRODUCTS, ADD, SUB, NEG, ADDC, MULC
+from modprime import add, mul, sub, summation
+
+# ---------------------------------------------------------------------------
+
+def destinations(entry):
+  # GATES entries are either (type, dest, leg, ...) or
+  # (type, [(dest, leg), ...], ...) - returns the destinations and the
+  # gate's parameters (the public constant of ADDC and MULC gates)
+  if isinstance(entry[1], list):
+    return entry[1], entry[2:]
+  return [(entry[1], entry[2])], entry[3:]
+
+def local_product(inputs):
+  # our share of a MUL or DOT gate's product, of degree 2T - a MUL gate is
+  # a DOT gate with a single pair of legs
+  return summation([mul(x, y) for x, y in zip(inputs[0::2], inputs[1::2])])
+
+def linear_gate(kind, inputs, constant):
+  # evaluate a gate that needs no communication on our shares
+  if kind == ADD:
+    return add(inputs[0], inputs[1])
+  if kind == SUB:
+    return sub(inputs[0], inputs[1])
+  if kind == NEG:
+    return sub(0, inputs[0])
+  if kind == ADDC:
+    return add(inputs[0], constant)
+  if kind == MULC:
+    return mul(inputs[0], constant)
+
+class Wiring():
+  def __init__(self, gates):
+    size = max(gates) + 1      # arrays are indexed by gate id, 0 is unused
+
+    self.gates = list(gates)   # gates are defined in evaluation order
+    self.types = array.array('b', [-1] * size)
+    self.fanout = [[] for g in range(size)]
+    fanin = [[] for g in range(size)]
+
+    self.constants = {}        # public constant of ADDC and MULC gates
+    self.output = None         # gate driving the circuit output wire
+    self.output_wire = None    # (dest, leg) outside the circuit
+
+    for gate, entry in gates.items():
+      self.types[gate] = entry[0]
+      dests, params = destinations(entry)
+      if params:
+        self.constants[gate] = params[0] % PRIME
+      for dest, leg in dests:
+        if dest in gates:
+          self.fanout[gate].append((dest, leg))
+          fanin[dest].append((leg, gate))
+        else:
+          self.output, self.output_wire = gate, (dest, leg)
+
+    # fan-in sources of each gate ordered by leg, ties keep gate order
+    self.sources = [tuple(g for (leg, g) in sorted(fanin[gate], key=lambda x: x[0]))
+                    for gate in range(size)]
+
+    # multiplicative depth: INP gates are at depth 0, an ADD gate is as
+    # deep as its deepest input and a MUL or DOT gate one deeper
+    self.depths = array.array('l', [0] * size)
+    for gate in self.gates:
+      depth = max((self.depths[src] for src in self.sources[gate]), default=0)
+      self.depths[gate] = depth + 1 if self.types[gate] in PRODUCTS else depth
+
+    self.layers = [[] for d in range(max(self.depths) + 1)]
+    for gate in self.gates:
+      self.layers[self.depths[gate]].append(gate)
+
+WIRING = Wiring(GATES)